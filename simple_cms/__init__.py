@@ -0,0 +1 @@
+default_app_config = 'simple_cms.apps.SimpleCmsConfig'
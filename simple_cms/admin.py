@@ -4,14 +4,27 @@ from django.contrib.sites.models import Site
 from django.contrib.contenttypes.admin import GenericStackedInline, GenericTabularInline
 
 from simple_cms.models import *
+from simple_cms.cache import invalidate_model
+from simple_cms.search import get_backend
+
+def queryset_updated(queryset):
+    # update() skips the save signals
+    invalidate_model(queryset.model)
+    if queryset.model is Article:
+        ArchiveCount.objects.rebuild()
+        backend = get_backend()
+        for article in queryset.prefetch_related('tags'):
+            backend.update(article)
 
 def action_set_active(modeladmin, request, queryset):
     queryset.update(active=True)
+    queryset_updated(queryset)
 
 action_set_active.short_description = 'Make published'
 
 def action_set_inactive(modeladmin, request, queryset):
     queryset.update(active=False)
+    queryset_updated(queryset)
 
 action_set_inactive.short_description = 'Make un-published'
 
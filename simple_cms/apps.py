@@ -0,0 +1,15 @@
+from django.apps import AppConfig
+from django.core import checks
+
+class SimpleCmsConfig(AppConfig):
+    name = 'simple_cms'
+    verbose_name = 'Simple CMS'
+
+    def ready(self):
+        from simple_cms.checks import check_navigation_registry, check_navigation_tree_fields
+        from simple_cms.registry import registry
+        from simple_cms.signals import connect_signals
+        connect_signals()
+        registry.load()
+        checks.register(check_navigation_tree_fields, checks.Tags.database, 'simple_cms')
+        checks.register(check_navigation_registry, checks.Tags.database, 'simple_cms')
@@ -0,0 +1,541 @@
+"""
+Process-wide caches for simple_cms.
+
+Every cache here is validated against per-model version counters kept in the
+shared Django cache (SIMPLE_CMS_CACHE, 'default' unless set), so a save in one
+worker process is noticed by all the others. Counters are bumped from the
+signal handlers in simple_cms.signals once the surrounding transaction commits.
+During a request the counters are read from the shared cache once, at first use,
+so a page costs one round trip for them however many caches it consults.
+"""
+import collections
+import hashlib
+import re
+import threading
+import time
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+
+VERSION_KEY_PREFIX = 'simple_cms:version:'
+
+_local_versions = {}
+_lock = threading.RLock()
+
+def get_cache():
+    return caches[getattr(settings, 'SIMPLE_CMS_CACHE', 'default')]
+
+# every version read during a request is served from one get_many of all of these
+VERSION_NAMES = ('navigation', 'navigationgroup', 'site', 'block', 'blockgroup', 'relatedblock', 'seo', 'article', 'category', 'published')
+
+_request = threading.local()
+
+def start_request(**kwargs):
+    """ request_started receiver, the shared versions are read once from here until request_finished """
+    _request.versions = {}
+
+def finish_request(**kwargs):
+    _request.versions = None
+
+def read_shared_versions(names):
+    """
+    {name: token} straight from the shared cache.
+    Missing tokens are created, so a token dropped by the cache never brings back entries stored before it.
+    """
+    cache = get_cache()
+    keys = dict((VERSION_KEY_PREFIX + name, name) for name in names)
+    shared = cache.get_many(list(keys))
+    missing = [key for key in keys if shared.get(key) is None]
+    if missing:
+        for key in missing:
+            cache.add(key, uuid.uuid4().hex, None)
+        shared.update(cache.get_many(missing))
+    return dict((name, shared.get(key)) for key, name in keys.items())
+
+def get_tokens(names):
+    """ Shared tokens of names, from the snapshot of the current request when there is one """
+    snapshot = getattr(_request, 'versions', None)
+    if snapshot is None:
+        return read_shared_versions(names)
+    if not set(names).issubset(snapshot):
+        snapshot.update(read_shared_versions(set(names).union(VERSION_NAMES).difference(snapshot)))
+    return snapshot
+
+def get_versions(*names):
+    """
+    Current version tuple for the given model names.
+    Includes a process local counter so invalidation still works with a dummy cache backend.
+    """
+    tokens = get_tokens(names)
+    return tuple((tokens[name], _local_versions.get(name, 0)) for name in names)
+
+def get_shared_versions(*names):
+    """ Version tokens from the shared cache only, the same in every process, for keys and ETags other processes see """
+    tokens = get_tokens(names)
+    return tuple(tokens[name] for name in names)
+
+def bump_version(name):
+    token = uuid.uuid4().hex
+    with _lock:
+        _local_versions[name] = _local_versions.get(name, 0) + 1
+    get_cache().set(VERSION_KEY_PREFIX + name, token, None)
+    snapshot = getattr(_request, 'versions', None)
+    if snapshot is not None:
+        snapshot[name] = token
+
+def invalidate_model(model):
+    """ Mark everything cached from model as stale, eg. after a queryset.update() """
+    bump_version(model._meta.model_name)
+
+class CacheStats(object):
+
+    def __init__(self, name):
+        self.name = name
+        self.reset()
+
+    def reset(self):
+        self.hits = 0
+        self.misses = 0
+
+    def hit(self):
+        self.hits += 1
+
+    def miss(self):
+        self.misses += 1
+
+    @property
+    def hit_rate(self):
+        total = self.hits + self.misses
+        if total:
+            return float(self.hits) / total
+        return 0.0
+
+    def as_dict(self):
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hit_rate,
+        }
+
+_stats = {}
+
+def get_stats(name=None):
+    """ Hit/miss counters of a single cache, or all of them keyed by name """
+    if name:
+        return _stats.setdefault(name, CacheStats(name))
+    return dict((key, value.as_dict()) for key, value in _stats.items())
+
+class KeyedCache(object):
+    """
+    Process local dict of values, misses included (stored as None).
+    Emptied whenever the version of one of its dependencies changes, or once it grows past max_size.
+    """
+
+    def __init__(self, name, dependencies, max_size=10000):
+        self.name = name
+        self.dependencies = dependencies
+        self.max_size = max_size
+        self.versions = None
+        self.data = {}
+
+    def validate(self):
+        versions = get_versions(*self.dependencies)
+        if versions != self.versions or len(self.data) > self.max_size:
+            with _lock:
+                self.data = {}
+                self.versions = versions
+
+    def get_many(self, keys, fetch):
+        """ Values for keys, fetch(missing_keys) returns a dict of the ones not cached yet """
+        self.validate()
+        stats = get_stats(self.name)
+        data = self.data
+        found = {}
+        missing = []
+        for key in keys:
+            if key in data:
+                stats.hit()
+                found[key] = data[key]
+            else:
+                stats.miss()
+                missing.append(key)
+        if missing:
+            fetched = fetch(missing)
+            for key in missing:
+                data[key] = found[key] = fetched.get(key)
+        return found
+
+    def get(self, key, fetch):
+        return self.get_many([key], fetch)[key]
+
+seo_cache = KeyedCache('seo', ('seo',))
+block_cache = KeyedCache('blocks', ('block',))
+related_blocks_cache = KeyedCache('related_blocks', ('block', 'blockgroup', 'relatedblock', 'navigation'))
+
+class NavigationTree(object):
+    """
+    Snapshot of the active Navigation rows for a site (or all sites if site_id is None).
+    Pages are linked to their cached parent and carry their children,
+    so walking the tree does not touch the database.
+    Instances are shared between requests, treat them as read-only.
+    """
+    dependencies = ('navigation', 'navigationgroup', 'site')
+
+    def __init__(self, site_id=None):
+        from simple_cms.models import Navigation
+        queryset = Navigation.objects.filter(active=True).select_related('group').order_by('order')
+        if site_id:
+            queryset = queryset.filter(site_id=site_id)
+        self.site_id = site_id
+        self.pages = {}
+        self.paths = {}
+        self.children = {}
+        self.homepages = []
+        self.groups = {}
+        pages = list(queryset)
+        for page in pages:
+            self.pages[page.pk] = page
+            if page.group:
+                self.groups.setdefault(page.group.title, []).append(page)
+            self.paths.setdefault(page.path, []).append(page)
+            self.children.setdefault(page.parent_id, [])
+            page._tree_children = self.children.setdefault(page.pk, [])
+            if page.homepage:
+                self.homepages.append(page)
+        for page in pages:
+            parent = self.pages.get(page.parent_id)
+            if parent:
+                page.parent = parent
+            self.children[page.parent_id].append(page)
+        self.updated_at = max([page.updated_at for page in pages]) if pages else None
+        # every url NavigationView could answer, anything else is a guaranteed 404
+        self.routable_paths = frozenset(self.paths)
+        if self.homepages:
+            self.routable_paths |= frozenset([''])
+
+    def get(self, pk):
+        return self.pages.get(pk)
+
+    def get_children(self, pk):
+        return self.children.get(pk, [])
+
+    def get_group(self, title):
+        """ Pages of a NavigationGroup in menu order """
+        return self.groups.get(title, [])
+
+    def get_homepage(self):
+        if len(self.homepages) == 1:
+            return self.homepages[0]
+        return None
+
+    def find(self, paths):
+        """ Walk down the given paths, returning the chain of matching pages """
+        pageA = []
+        parent_id = None
+        for path in paths:
+            matches = [page for page in self.paths.get(path, []) if page.parent_id == parent_id]
+            if not matches:
+                break
+            pageA.append(matches[0])
+            parent_id = matches[0].pk
+        return pageA
+
+_trees = {}
+
+def navigation_cache_enabled():
+    return getattr(settings, 'SIMPLE_CMS_NAVIGATION_CACHE', True)
+
+def get_navigation_tree(site_id=None):
+    stats = get_stats('navigation')
+    versions = get_versions(*NavigationTree.dependencies)
+    cached = _trees.get(site_id)
+    if cached and cached[0] == versions:
+        stats.hit()
+        return cached[1]
+    stats.miss()
+    tree = NavigationTree(site_id)
+    with _lock:
+        _trees[site_id] = (versions, tree)
+    return tree
+
+class SiteMap(object):
+    """
+    Every Site keyed by domain, so resolving a request host never queries.
+    Hosts are also tried with and without a leading www. and through SIMPLE_CMS_SITE_ALIASES,
+    a dict of host to domain. Resolved hosts, misses included, are remembered.
+    """
+    dependencies = ('site',)
+    max_hosts = 1000
+
+    def __init__(self):
+        from django.contrib.sites.models import Site
+        self.sites = {}
+        self.domains = {}
+        for site in Site.objects.all():
+            self.sites[site.pk] = site
+            self.domains[site.domain.lower()] = site
+        self.aliases = dict((host.lower(), domain.lower()) for host, domain in getattr(settings, 'SIMPLE_CMS_SITE_ALIASES', {}).items())
+        self.hosts = {}
+
+    def get(self, pk):
+        return self.sites.get(pk)
+
+    def resolve(self, host):
+        host = host.lower()
+        try:
+            return self.hosts[host]
+        except KeyError:
+            pass
+        candidates = [host, self.aliases.get(host)]
+        if host.startswith('www.'):
+            candidates.append(host[4:])
+        else:
+            candidates.append('www.%s' % host)
+        site = None
+        for candidate in candidates:
+            if candidate in self.domains:
+                site = self.domains[candidate]
+                break
+        if len(self.hosts) >= self.max_hosts:
+            # unknown Host headers should not grow this forever
+            self.hosts.clear()
+        self.hosts[host] = site
+        return site
+
+_site_map = []
+
+def get_site_map():
+    stats = get_stats('sites')
+    versions = get_versions(*SiteMap.dependencies)
+    if _site_map and _site_map[0][0] == versions:
+        stats.hit()
+        return _site_map[0][1]
+    stats.miss()
+    site_map = SiteMap()
+    with _lock:
+        _site_map[:] = [(versions, site_map)]
+    return site_map
+
+def get_site_for_host(host):
+    """ Site for a request host, falling back to the site with pk 1 like NavigationHelper always has """
+    site_map = get_site_map()
+    site = site_map.resolve(host)
+    if site is None:
+        site = site_map.get(1)
+    return site
+
+class TemplateCache(object):
+    """
+    LRU of compiled templates keyed by a hash of their source, for CMS-authored text.
+    Bounded by SIMPLE_CMS_TEMPLATE_CACHE_SIZE entries and SIMPLE_CMS_TEMPLATE_CACHE_BYTES of source.
+    """
+
+    def __init__(self, max_entries=None, max_bytes=None):
+        self.max_entries = max_entries or getattr(settings, 'SIMPLE_CMS_TEMPLATE_CACHE_SIZE', 500)
+        self.max_bytes = max_bytes or getattr(settings, 'SIMPLE_CMS_TEMPLATE_CACHE_BYTES', 5 * 1024 * 1024)
+        self.templates = collections.OrderedDict()
+        self.size = 0
+
+    def get(self, source):
+        from django.template import Template
+        stats = get_stats('templates')
+        source_bytes = source.encode('utf-8')
+        key = hashlib.sha1(source_bytes).hexdigest()
+        with _lock:
+            if key in self.templates:
+                stats.hit()
+                # most recently used goes last
+                entry = self.templates.pop(key)
+                self.templates[key] = entry
+                return entry[0]
+        stats.miss()
+        compiled = Template(source)
+        with _lock:
+            if key not in self.templates:
+                self.templates[key] = (compiled, len(source_bytes))
+                self.size += len(source_bytes)
+            while self.templates and (len(self.templates) > self.max_entries or self.size > self.max_bytes):
+                self.size -= self.templates.popitem(last=False)[1][1]
+        return compiled
+
+_template_cache = []
+
+def get_compiled_template(source):
+    if not _template_cache:
+        _template_cache.append(TemplateCache())
+    return _template_cache[0].get(source)
+
+class PageUrlMap(object):
+    """
+    (domain, url, path) of every Navigation page, active or not, keyed by id.
+    Loaded in one query, and patched in place for the saved page and its descendants
+    instead of reloading everything, see page_saved.
+    """
+    dependencies = ('navigation', 'site')
+
+    def __init__(self):
+        self.versions = None
+        self.urls = {}
+
+    def load(self, queryset):
+        return dict((pk, (domain, url, path)) for pk, domain, url, path in queryset.values_list('pk', 'site__domain', 'url', 'path'))
+
+    def get_urls(self):
+        from simple_cms.models import Navigation
+        stats = get_stats('page_urls')
+        versions = get_versions(*self.dependencies)
+        if versions == self.versions:
+            stats.hit()
+            return self.urls
+        stats.miss()
+        urls = self.load(Navigation.objects.all())
+        with _lock:
+            self.urls, self.versions = urls, versions
+        return urls
+
+    def page_saved(self, pk):
+        """ Bump the navigation version, patching the map rather than dropping it if it was current """
+        from django.db.models import Q
+        from simple_cms.models import Navigation
+        current = self.versions is not None and self.versions == get_versions(*self.dependencies)
+        bump_version('navigation')
+        if not current:
+            return
+        descendants = Q(ancestor_ids='%s' % pk) | Q(ancestor_ids__startswith='%s,' % pk) | Q(ancestor_ids__endswith=',%s' % pk) | Q(ancestor_ids__contains=',%s,' % pk)
+        urls = dict(self.urls)
+        urls.update(self.load(Navigation.objects.filter(Q(pk=pk) | descendants)))
+        with _lock:
+            self.urls, self.versions = urls, get_versions(*self.dependencies)
+
+page_url_map = PageUrlMap()
+
+def get_page_url(pk, protocol='http://'):
+    """ Absolute url of a Navigation page, '' if it does not exist """
+    try:
+        domain, url, path = page_url_map.get_urls()[int(pk)]
+    except (KeyError, TypeError, ValueError):
+        return ''
+    if url:
+        return url
+    return '%s%s/%s/' % (protocol, domain, path)
+
+PAGE_LINK_RE = re.compile(r'\[\[page:(\d+)\]\]')
+
+def resolve_page_links(text, protocol='http://'):
+    """ Replace every [[page:<id>]] placeholder in text with the url of that page, in one pass """
+    return PAGE_LINK_RE.sub(lambda match: get_page_url(match.group(1), protocol), text)
+
+FRAGMENT_KEY_PREFIX = 'simple_cms:fragment:'
+# every model the simple_cms tags read from, so a fragment around any of them is never served stale
+FRAGMENT_DEPENDENCIES = VERSION_NAMES
+
+def get_fragment_key(name, dependencies=FRAGMENT_DEPENDENCIES, vary_on=()):
+    """
+    Cache key of a template fragment, changing whenever one of its dependencies is saved.
+    Built from the shared version tokens only, so every process renders into, and locks, the same key.
+    """
+    if 'published' in dependencies:
+        get_publish_window()
+    args = [name, get_shared_versions(*dependencies)] + list(vary_on)
+    return FRAGMENT_KEY_PREFIX + hashlib.md5(repr(args).encode('utf-8')).hexdigest()
+
+def get_fragment(key, render, timeout=None):
+    """
+    Cached value of key, calling render() to fill it on a miss.
+    Only one caller renders a missing fragment, the others wait up to
+    SIMPLE_CMS_FRAGMENT_LOCK_TIMEOUT seconds for it before rendering it themselves.
+    """
+    stats = get_stats('fragments')
+    cache = get_cache()
+    value = cache.get(key)
+    if value is not None:
+        stats.hit()
+        return value
+    stats.miss()
+    lock_timeout = getattr(settings, 'SIMPLE_CMS_FRAGMENT_LOCK_TIMEOUT', 10)
+    if cache.add(key + ':lock', 1, lock_timeout):
+        try:
+            value = render()
+            cache.set(key, value, timeout)
+        finally:
+            cache.delete(key + ':lock')
+        return value
+    waited = 0
+    while waited < lock_timeout:
+        time.sleep(0.05)
+        waited += 0.05
+        value = cache.get(key)
+        if value is not None:
+            return value
+    return render()
+
+PUBLISH_WINDOW_KEY = 'simple_cms:publish_window'
+
+def publish_window_open(next_start, next_end, now):
+    # publish_start <= now and publish_end >= now, so an end is still published at that exact time
+    if next_start is not None and now >= next_start:
+        return False
+    if next_end is not None and now > next_end:
+        return False
+    return True
+
+class PublishWindow(object):
+    """
+    Span of time from now in which no active article starts or stops being published.
+    get_published uses the start of the window as now, so it builds the same SQL throughout the window.
+    get_published_ids keeps the evaluated ids in the shared cache under get_published_key until the
+    next publish_start or publish_end, as do {% cms_cache %} fragments depending on 'published'.
+    """
+    dependencies = ('article',)
+
+    def __init__(self, now):
+        from simple_cms.models import Article
+        articles = Article.objects.get_active()
+        self.now = now
+        # both served by the (active, publish_start) and (active, publish_end) indexes
+        self.next_start = articles.filter(publish_start__gt=now).order_by('publish_start').values_list('publish_start', flat=True).first()
+        self.next_end = articles.filter(publish_end__gte=now).order_by('publish_end').values_list('publish_end', flat=True).first()
+
+    def is_current(self, now):
+        return publish_window_open(self.next_start, self.next_end, now)
+
+_publish_window = []
+
+def get_publish_window():
+    """
+    Current PublishWindow. Once time passes the next publish_start or publish_end of the last window
+    stored in the shared cache, the 'published' version is bumped and
+    simple_cms.signals.publish_transition is sent, by whichever process notices first.
+    """
+    from django.utils import timezone
+    stats = get_stats('publish_window')
+    now = timezone.now()
+    versions = get_versions(*PublishWindow.dependencies)
+    if _publish_window and _publish_window[0][0] == versions and _publish_window[0][1].is_current(now):
+        stats.hit()
+        return _publish_window[0][1]
+    stats.miss()
+    window = PublishWindow(now)
+    cache = get_cache()
+    shared = cache.get(PUBLISH_WINDOW_KEY)
+    if shared and not publish_window_open(shared[0], shared[1], now):
+        boundary = min([value for value in shared if value is not None])
+        if cache.add('simple_cms:publish_transition:%s' % boundary.isoformat(), 1, 86400):
+            from simple_cms.signals import publish_transition
+            bump_version('published')
+            publish_transition.send(sender=PublishWindow, boundary=boundary, window=window)
+    cache.set(PUBLISH_WINDOW_KEY, (window.next_start, window.next_end), None)
+    with _lock:
+        _publish_window[:] = [(versions, window)]
+    return window
+
+PUBLISHED_KEY_PREFIX = 'simple_cms:published:'
+
+def get_published_key(window):
+    """
+    Shared cache key of the published articles in window. Keyed on the window boundaries rather than its
+    start, which every process picks for itself, so all processes share one entry until the window ends.
+    """
+    args = (get_shared_versions('article', 'published'), window.next_start, window.next_end)
+    return PUBLISHED_KEY_PREFIX + hashlib.md5(repr(args).encode('utf-8')).hexdigest()
@@ -0,0 +1,44 @@
+from django.core import checks
+from django.db import DatabaseError
+
+def check_navigation_tree_fields(app_configs, **kwargs):
+    """ Reads every Navigation page, so it is tagged database: only run by migrate and "manage.py check --tag database" """
+    from simple_cms.management.commands.rebuild_navigation import find_stale_tree_fields
+    try:
+        stale = find_stale_tree_fields()
+    except DatabaseError:
+        # not migrated yet
+        return []
+    if stale:
+        return [checks.Warning(
+            '%s Navigation pages have a stale stored path, title chain, ancestors or depth.' % len(stale),
+            hint='Run "manage.py rebuild_navigation".',
+            id='simple_cms.W001',
+        )]
+    return []
+
+def check_navigation_registry(app_configs, **kwargs):
+    """ Every Navigation.view and Navigation.template must resolve, reads every Navigation page so it is tagged database too """
+    from django.conf import settings
+    from django.utils.module_loading import import_string
+    from simple_cms.registry import registry
+    errors = []
+    if hasattr(settings, 'SIMPLE_CMS_CONTEXT_PROCESSOR'):
+        try:
+            import_string(settings.SIMPLE_CMS_CONTEXT_PROCESSOR)
+        except ImportError:
+            errors.append(checks.Warning(
+                'SIMPLE_CMS_CONTEXT_PROCESSOR "%s" can not be imported, NavigationHelper is used instead.' % settings.SIMPLE_CMS_CONTEXT_PROCESSOR,
+                id='simple_cms.W002',
+            ))
+    try:
+        failures = registry.preload()
+    except DatabaseError:
+        return errors
+    for field, value, e in failures:
+        errors.append(checks.Error(
+            'Navigation %s "%s" can not be loaded: %s' % (field, value, e),
+            hint='Fix the %s of the Navigation pages using it.' % field,
+            id='simple_cms.E001' if field == 'view' else 'simple_cms.E002',
+        ))
+    return errors
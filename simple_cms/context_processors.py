@@ -2,6 +2,11 @@ from django.contrib.sites.models import Site
 from django.contrib.sites.requests import RequestSite
 from django.conf import settings
 
+from django.db.models import Q
+
+from simple_cms.cache import get_navigation_tree, get_site_for_host, navigation_cache_enabled
+from simple_cms.menu import build_menu, menu_trail
+from simple_cms.registry import registry
 from simple_cms.models import Navigation
 
 class NavigationHelper(object):
@@ -16,25 +21,39 @@ class NavigationHelper(object):
         self.parent = None
         self.nav2_parent = None
         self.nav3_parent = None
+        self.menu = None
+        self.nav_levels = []
         self.exact_match = False
+        self.path_lookup = getattr(settings, 'SIMPLE_CMS_PATH_LOOKUP', True)
+        self.use_cache = navigation_cache_enabled()
         try:
             self.check_domain = settings.SIMPLE_CMS_CHECK_DOMAIN
         except:
             self.check_domain = False
         if self.check_domain:
-            try:
-                self.site = Site.objects.get(domain=RequestSite(request).domain)
-            except:
-                self.site = Site.objects.get(pk=1)
+            self.site = get_site_for_host(RequestSite(request).domain)
         else:
             try:
                 self.site = Site.objects.get_current()
             except:
                 self.site = Site.objects.get(pk=1)
     
+    def get_tree(self):
+        """ Cached navigation snapshot, matching the site filtering of the database lookups """
+        if self.check_domain and self.site:
+            return get_navigation_tree(self.site.pk)
+        return get_navigation_tree()
+
     def is_homepage(self):
         try:
             if self.urlA[0] == '':
+                if self.use_cache:
+                    self.page = self.get_tree().get_homepage()
+                    if not self.page:
+                        return False
+                    self.pageA.append(self.page)
+                    self.exact_match = True
+                    return True
                 try:
                     kwargs = {'active':True, 'homepage':True}
                     if self.check_domain and self.site:
@@ -58,6 +77,44 @@ class NavigationHelper(object):
                     return
         except KeyError:
             pass
+        if self.path_lookup:
+            self.find_page_by_path(admin_preview)
+        else:
+            self.find_page_by_slug(admin_preview)
+        # check for exact match, need to ignore the trailing anchors and so on, so reassemble the
+        if self.page:
+            if self.page.get_absolute_url() == '/%s/' % '/'.join(self.urlA):
+                self.exact_match = True
+
+    def find_page_by_path(self, admin_preview=False):
+        """ Fetch the page and all of its ancestors with a single lookup on the stored path """
+        paths = ['/'.join(self.urlA[:i]) for i in range(1, len(self.urlA) + 1)]
+        if self.use_cache and not admin_preview:
+            self.pageA = self.get_tree().find(paths)
+            if self.pageA:
+                self.page = self.pageA[-1]
+            return
+        kwargs = {'active': True, 'path__in': paths}
+        if admin_preview:
+            del kwargs['active']
+        if self.check_domain and self.site:
+            kwargs['site'] = self.site
+        candidates = {}
+        for page in Navigation.objects.filter(**kwargs):
+            candidates.setdefault(page.path, []).append(page)
+        # walk down the url, same as the slug lookup, stopping at the first missing segment
+        for path in paths:
+            parent_id = self.page.pk if self.page else None
+            matches = [page for page in candidates.get(path, []) if page.parent_id == parent_id]
+            if not matches:
+                break
+            if self.page:
+                matches[0].parent = self.page
+            self.page = matches[0]
+            self.pageA.append(self.page)
+
+    def find_page_by_slug(self, admin_preview=False):
+        """ Original lookup, one query per url segment """
         for slug in self.urlA:
             try:
                 kwargs = {'active': True, 'parent':self.page, 'slug':slug}
@@ -69,30 +126,36 @@ class NavigationHelper(object):
                 self.pageA.append(self.page)
             except Navigation.DoesNotExist:
                 break
-        # check for exact match, need to ignore the trailing anchors and so on, so reassemble the
-        if self.page:
-            if self.page.get_absolute_url() == '/%s/' % '/'.join(self.urlA):
-                self.exact_match = True
     
     def define_nav(self):
+        """
+        Build the active menu below the page's root, to any depth.
+        nav_levels holds the child lists along the active trail, nav2 and nav3 are the first two.
+        """
         if self.page:
-            # TODO: max template depth allowed, so hard code?
-            if self.page.depth == 0:
-                self.parent = self.page
-                self.nav2 = list(self.page.children.all().filter(active=True).order_by('order'))
-                self.nav2_parent = self.page
-            if self.page.depth == 1:
-                self.parent = self.page.parent
-                self.nav2 = list(self.page.parent.children.all().filter(active=True).order_by('order'))
-                self.nav2_parent = self.page.parent
-                self.nav3 = list(self.page.children.all().filter(active=True).order_by('order'))
-                self.nav3_parent = self.page
-            if self.page.depth == 2:
-                self.parent = self.page.parent.parent
-                self.nav2 = list(self.page.parent.parent.children.all().filter(active=True).order_by('order'))
-                self.nav2_parent = self.page.parent.parent
-                self.nav3 = list(self.page.parent.children.all().filter(active=True).order_by('order'))
-                self.nav3_parent = self.page.parent
+            if self.pageA and self.pageA[0].parent_id is None:
+                root = self.pageA[0]
+            else:
+                root = self.page.root()
+            if self.use_cache:
+                get_children = self.get_tree().get_children
+            else:
+                children = {}
+                descendants = Navigation.objects.filter(
+                    Q(ancestor_ids='%s' % root.pk) | Q(ancestor_ids__startswith='%s,' % root.pk), active=True
+                ).order_by('order')
+                for page in descendants:
+                    children.setdefault(page.parent_id, []).append(page)
+                get_children = lambda pk: children.get(pk, [])
+            self.menu = build_menu(root, get_children, self.page.get_ancestor_ids() + [self.page.pk], self.page.pk)
+            trail = menu_trail(self.menu)
+            self.nav_levels = [node.children for node in trail]
+            self.parent = root
+            self.nav2 = [node.page for node in self.nav_levels[0]]
+            self.nav2_parent = root
+            if len(trail) > 1:
+                self.nav3 = [node.page for node in self.nav_levels[1]]
+                self.nav3_parent = trail[1].page
     
     def extra_context(self):
         return None
@@ -108,32 +171,35 @@ class NavigationHelper(object):
             'nav2_parent': self.nav2_parent,
             'nav3': self.nav3,
             'nav3_parent': self.nav3_parent,
+            'menu': self.menu,
+            'nav_levels': self.nav_levels,
             'exact_match': self.exact_match,
         }
         if self.page:
-            if len(self.page.seo.all()) == 1:
-                r.update({'seo': self.page.seo.all()[0]})
+            seo = self.page.get_seo()
+            if seo:
+                r.update({'seo': seo})
         if self.extra_context():
             r.update(self.extra_context())
         return r
 
 def navigation(request):
-    """ Look up matching request in navigation and use for pagebuilder """
+    """
+    Look up matching request in navigation and use for pagebuilder
+    The result is kept on the request, so every later RequestContext reuses it.
+    """
     try:
-        module = settings.SIMPLE_CMS_CONTEXT_PROCESSOR
-        tA = module.split('.')
-        c = tA.pop()
-        import_string = 'from %s import %s' % ('.'.join(tA), c)
-        exec(import_string)
-        cls = eval(c)
-    except (AttributeError, ImportError):
-        cls = NavigationHelper
+        return request._simple_cms_navigation
+    except AttributeError:
+        pass
+    cls = registry.get_helper_class()
     inst = cls(request)
     if inst.is_homepage():
         pass
     else:
         inst.find_page()
     inst.define_nav()
-    return inst.context()
+    request._simple_cms_navigation = inst.context()
+    return request._simple_cms_navigation
 
    
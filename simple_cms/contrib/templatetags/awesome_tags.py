@@ -3,6 +3,8 @@ from django.template import Node
 from django.apps import apps
 from django.contrib.sites.models import Site
 
+from simple_cms.instrumentation import instrument_library
+
 register = template.Library()
 
 # TODO: add order_by
@@ -196,3 +198,5 @@ def path_in_url(parser, token):
         raise template.TemplateSyntaxError(
             "%r tag requires arguments" % token.contents.split()[0])
     return PathNode(args[1], args[2], args[4])
+
+instrument_library(register)
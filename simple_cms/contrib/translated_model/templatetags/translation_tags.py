@@ -1,6 +1,9 @@
+import copy
+
 from django.utils.safestring import mark_safe
 
 from simple_cms.contrib.translated_model.models import LocalizationTranslation
+from simple_cms.instrumentation import instrument_library
 from simple_cms.models import CommonAbstractModel
 from django import template
 from django.conf import settings
@@ -15,8 +18,9 @@ def _translate_instance(instance, code):
     try:
         translations = instance.translations.filter(language__code=code, active=True)
         if len(translations):
-            # map the non empty values on to the original instance
+            # map the non empty values on to a copy, the original may be shared by the navigation cache
             translation = translations[0]
+            instance = copy.copy(instance)
             # TODO: find out how to properly obtain the base classes up to models.Model and exclude all of their fields
             # TODO: find out how to properly obtain the PK fieldname
             excluded = CommonAbstractModel._meta.get_all_field_names() + ['id']
@@ -81,4 +85,6 @@ def translate_string(context, key, default=''):
                 return mark_safe(LocalizationTranslation.objects.get(localization__name=key, language__code='en-us').text)
             except LocalizationTranslation.DoesNotExist:
                 return default
-    return default
\ No newline at end of file
+    return default
+
+instrument_library(register)
@@ -1,7 +1,8 @@
 from django.views.generic import ListView
 from simple_cms.contrib.utils import digg_paginator
+from simple_cms.pagination import CursorPaginationMixin
 
-class DataGridView(ListView):
+class DataGridView(CursorPaginationMixin, ListView):
     sort_column = None
     sort_direction = 'asc'
     sort = None
@@ -12,11 +13,10 @@ class DataGridView(ListView):
     def get(self, request, *args, **kwargs):
         self.querystring = request.GET.copy()
         querystring = request.GET.copy()
-        try:
-            del(self.querystring['page'])
-            del(querystring['page'])
-        except KeyError:
-            pass
+        # sorting restarts paging, so the links carry neither a page nor a cursor
+        for name in ('page', 'cursor'):
+            self.querystring.pop(name, None)
+            querystring.pop(name, None)
         try:
             self.sort = request.GET['sort_column']
             self.sort_column = self.sort
@@ -52,6 +52,14 @@ class DataGridView(ListView):
     def get_queryset(self):
         queryset = super(DataGridView, self).get_queryset()
         return queryset.order_by(self.sort)
+
+    def get_cursor_ordering(self):
+        # pk breaks ties, cursors need a unique last column
+        if not self.sort:
+            return ('pk',)
+        if self.sort.startswith('-'):
+            return (self.sort, '-pk')
+        return (self.sort, 'pk')
     
     def get_context_data(self, *args, **kwargs):
         context = super(DataGridView, self).get_context_data(*args, **kwargs)
@@ -5,4 +5,9 @@ class ArticleSearchForm(forms.Form):
     
     def __init__(self, *args, **kwargs):
         super(ArticleSearchForm, self).__init__(*args, **kwargs)
-        self.fields['q'].widget.attrs = {'class':'text', 'title':'Search by keyword...'}
\ No newline at end of file
+        self.fields['q'].widget.attrs = {'class':'text', 'title':'Search by keyword...'}
+
+    def search(self):
+        """ Ranked SearchResults for a valid form, see simple_cms.search """
+        from simple_cms.search import search_articles
+        return search_articles(self.cleaned_data['q'])
@@ -0,0 +1,96 @@
+"""
+Opt-in timing of the simple_cms template tags and filters.
+
+Set SIMPLE_CMS_INSTRUMENT_TAGS = True and add
+simple_cms.middleware.TagTimingMiddleware first in the middleware settings.
+Every tag and filter then records its calls, database queries and wall time
+for the request. The totals are sent as a Server-Timing header and logged to
+the 'simple_cms.instrumentation' logger. Nested tags are included in the time
+of the tag that renders them, eg. a get_block inside a cms_cache.
+With the setting off the libraries are left untouched.
+"""
+import collections
+import functools
+import threading
+import time
+
+from django.conf import settings
+from django.db import connections
+
+_local = threading.local()
+
+def instrumentation_enabled():
+    return getattr(settings, 'SIMPLE_CMS_INSTRUMENT_TAGS', False)
+
+def query_count():
+    return sum([len(connection.queries_log) for connection in connections.all()])
+
+class TagTimings(object):
+    """ Calls, queries and seconds per tag or filter name, in first use order """
+
+    def __init__(self):
+        self.tags = collections.OrderedDict()
+
+    def record(self, name, queries, seconds):
+        calls, total_queries, total_seconds = self.tags.get(name, (0, 0, 0.0))
+        self.tags[name] = (calls + 1, total_queries + queries, total_seconds + seconds)
+
+    def as_dict(self):
+        return collections.OrderedDict((name, {
+            'calls': calls,
+            'queries': queries,
+            'ms': round(seconds * 1000, 3),
+        }) for name, (calls, queries, seconds) in self.tags.items())
+
+    def server_timing(self):
+        return ', '.join(['cms-%s;dur=%.3f;desc="%s calls, %s queries"' % (name, seconds * 1000, calls, queries)
+            for name, (calls, queries, seconds) in self.tags.items()])
+
+def start():
+    """ Begin recording for the current thread, forcing the query logs on so they can be counted """
+    _local.timings = TagTimings()
+    _local.debug_cursors = [(connection, connection.force_debug_cursor) for connection in connections.all()]
+    for connection, force_debug_cursor in _local.debug_cursors:
+        connection.force_debug_cursor = True
+
+def stop():
+    """ Stop recording, returning the TagTimings of the current thread or None """
+    timings = getattr(_local, 'timings', None)
+    for connection, force_debug_cursor in getattr(_local, 'debug_cursors', []):
+        connection.force_debug_cursor = force_debug_cursor
+    _local.timings = None
+    _local.debug_cursors = []
+    return timings
+
+def timed(name, func):
+    """ Wrap func to record each call while a request is being instrumented """
+    @functools.wraps(func)
+    def wrapper(*args, **kwargs):
+        timings = getattr(_local, 'timings', None)
+        if timings is None:
+            return func(*args, **kwargs)
+        queries = query_count()
+        started = time.time()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            timings.record(name, query_count() - queries, time.time() - started)
+    return wrapper
+
+def timed_tag(name, compile_function):
+    @functools.wraps(compile_function)
+    def wrapper(parser, token):
+        node = compile_function(parser, token)
+        node.render = timed(name, node.render)
+        return node
+    return wrapper
+
+def instrument_library(register):
+    """ Time every tag and filter of a template Library, called at the end of each simple_cms tag module """
+    if not instrumentation_enabled():
+        return register
+    for name, compile_function in list(register.tags.items()):
+        register.tags[name] = timed_tag(name, compile_function)
+    for name, func in list(register.filters.items()):
+        register.filters[name] = timed(name, func)
+    return register
@@ -0,0 +1,87 @@
+import json
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+
+from simple_cms.models import ArchiveCount, Article, Block, Navigation, RelatedBlock, Seo
+
+def get_hot_queries():
+    """
+    (name, queryset) of the lookups simple_cms runs on every request or cache refill, for a database
+    without content. simple_cms.tests.QueryPlanTest checks the statements the real code runs.
+    """
+    navigation = ContentType.objects.get_for_model(Navigation)
+    articles = Article.objects.get_published()
+    # aware under USE_TZ, a naive value would warn
+    now = timezone.now()
+    return [
+        ('navigation tree', Navigation.objects.filter(active=True, site_id=1).order_by('order')),
+        ('find_page by path', Navigation.objects.filter(active=True, path__in=['a', 'a/b'])),
+        ('find_page by path for a site', Navigation.objects.filter(active=True, site_id=1, path__in=['a', 'a/b'])),
+        ('find_page by slug', Navigation.objects.filter(active=True, parent=None, slug='a')),
+        ('find_page by slug for a site', Navigation.objects.filter(active=True, site_id=1, parent=None, slug='a')),
+        ('get_block', Block.objects.filter(active=True, key__in=['a', 'b'])),
+        ('get_blocks', RelatedBlock.objects.filter(content_type=navigation, object_id__in=[1, 2], active=True, group__title='a').select_related('block').order_by('order')),
+        ('seo', Seo.objects.filter(content_type=navigation, object_id__in=[1, 2])),
+        ('get_active articles', Article.objects.get_active().order_by('-post_date', '-id')[:10]),
+        ('get_published articles', articles.order_by('-post_date', '-id')[:10]),
+        ('next publish_start', Article.objects.get_active().filter(publish_start__gt=now).order_by('publish_start').values_list('publish_start')[:1]),
+        ('next publish_end', Article.objects.get_active().filter(publish_end__gte=now).order_by('publish_end').values_list('publish_end')[:1]),
+        ('previous article', articles.filter(Q(post_date__lt=now) | Q(post_date=now, pk__lt=1)).order_by('-post_date', '-pk')[:1]),
+        ('archive keys', ArchiveCount.objects.filter(kind='year', count__gt=0)),
+        ('archive count', ArchiveCount.objects.filter(kind='tag', key__in=['a'])),
+        ('year articles', Article.objects.get_active().filter(post_date__year=2015)),
+    ]
+
+def explain_sqlite(sql, params=()):
+    """ Plan lines, and the tables read without any index """
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN QUERY PLAN ' + sql, params)
+        lines = [row[-1] for row in cursor.fetchall()]
+    scans = [line for line in lines if line.startswith('SCAN') and 'USING' not in line]
+    return lines, scans
+
+def explain_postgresql(sql, params=()):
+    """ Plan node types, and the tables read by a sequential scan even with those discouraged """
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute('SET LOCAL enable_seqscan = off')
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    lines = []
+    scans = []
+    nodes = [plan[0]['Plan']]
+    while nodes:
+        node = nodes.pop()
+        lines.append('%s %s' % (node['Node Type'], node.get('Relation Name', '')))
+        if node['Node Type'] == 'Seq Scan':
+            scans.append(lines[-1])
+        nodes.extend(node.get('Plans', []))
+    return lines, scans
+
+def get_explain():
+    """ explain(sql, params) for the current database, None if plans can't be checked on it """
+    return {'sqlite': explain_sqlite, 'postgresql': explain_postgresql}.get(connection.vendor)
+
+class Command(BaseCommand):
+    help = 'EXPLAIN the hot simple_cms queries, failing if any of them reads a whole table'
+
+    def handle(self, *args, **options):
+        explain = get_explain()
+        if explain is None:
+            raise CommandError('Query plans can only be checked on SQLite or PostgreSQL, not %s' % connection.vendor)
+        failed = []
+        for name, queryset in get_hot_queries():
+            lines, scans = explain(*queryset.query.sql_with_params())
+            if scans:
+                failed.append(name)
+            self.stdout.write('%s %s' % ('FULL SCAN' if scans else 'ok', name))
+            if scans or int(options['verbosity']) > 1:
+                for line in lines:
+                    self.stdout.write('    %s' % line)
+        if failed:
+            raise CommandError('Full table scans in: %s' % ', '.join(failed))
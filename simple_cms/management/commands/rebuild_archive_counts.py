@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+
+from simple_cms.models import ArchiveCount
+
+class Command(BaseCommand):
+    help = 'Recount the published articles of every category, tag and year'
+
+    def handle(self, *args, **options):
+        counts = ArchiveCount.objects.rebuild()
+        self.stdout.write('Rebuilt %s archive counts' % len(counts))
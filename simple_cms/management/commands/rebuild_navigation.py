@@ -0,0 +1,26 @@
+from django.core.management.base import BaseCommand
+
+from simple_cms.cache import invalidate_model
+from simple_cms.models import Navigation, TREE_FIELDS, compute_tree_fields
+
+def find_stale_tree_fields():
+    """ Computed tree fields for every Navigation page whose stored values have drifted """
+    rows = list(Navigation.objects.values_list('pk', 'parent_id', 'slug', 'title', *TREE_FIELDS))
+    computed = compute_tree_fields([row[:4] for row in rows])
+    stale = {}
+    for row in rows:
+        fields = computed[row[0]]
+        if list(row[4:]) != [fields[name] for name in TREE_FIELDS]:
+            stale[row[0]] = fields
+    return stale
+
+class Command(BaseCommand):
+    help = 'Rebuild the stored path, title chain, ancestors and depth of all Navigation pages'
+
+    def handle(self, *args, **options):
+        stale = find_stale_tree_fields()
+        for pk, fields in stale.items():
+            Navigation.objects.filter(pk=pk).update(**fields)
+        if stale:
+            invalidate_model(Navigation)
+        self.stdout.write('Rebuilt %s of %s pages' % (len(stale), Navigation.objects.count()))
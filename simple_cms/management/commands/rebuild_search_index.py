@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from simple_cms.search import get_backend
+
+class Command(BaseCommand):
+    help = 'Reindex every published article in the configured search backend'
+
+    def handle(self, *args, **options):
+        backend = get_backend()
+        count = backend.rebuild()
+        self.stdout.write('Indexed %s articles with %s' % (count, backend.__class__.__name__))
@@ -0,0 +1,44 @@
+from multiprocessing import Pool
+
+from django.core.management.base import BaseCommand
+
+from simple_cms import renderers
+from simple_cms.cache import invalidate_model
+from simple_cms.models import Navigation, Block, Article
+
+def render_row(row):
+    pk, format, text = row
+    return (pk,) + renderers.render(format, text)
+
+class Command(BaseCommand):
+    help = 'Re-render the stored html of Navigation, Block and Article rows whose renderer version changed'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true', dest='all', default=False,
+            help='Re-render every row, not only the stale ones')
+        parser.add_argument('--processes', type=int, dest='processes', default=None,
+            help='Number of worker processes, defaults to the number of CPUs')
+
+    def handle(self, *args, **options):
+        pool = None
+        if options['processes'] != 1:
+            pool = Pool(options['processes'])
+        try:
+            for model in (Navigation, Block, Article):
+                rows = []
+                for pk, format, text, html_renderer in model.objects.filter(render_as_template=False).values_list('pk', 'format', 'text', 'html_renderer').iterator():
+                    if options['all'] or html_renderer != renderers.get_version(format):
+                        rows.append((pk, format, text))
+                if pool:
+                    results = pool.imap_unordered(render_row, rows, 50)
+                else:
+                    results = map(render_row, rows)
+                for pk, html, html_renderer in results:
+                    model.objects.filter(pk=pk).update(html=html, html_renderer=html_renderer)
+                if rows:
+                    invalidate_model(model)
+                self.stdout.write('%s: re-rendered %s rows' % (model._meta.verbose_name_plural, len(rows)))
+        finally:
+            if pool:
+                pool.close()
+                pool.join()
@@ -0,0 +1,45 @@
+class MenuNode(object):
+    """
+    A Navigation page placed in a menu.
+    Attributes not found on the node are read from the page, eg. node.title or node.get_absolute_url.
+    """
+
+    def __init__(self, page, depth=0, active=False, current=False):
+        self.page = page
+        self.depth = depth
+        self.active = active
+        self.current = current
+        self.children = []
+
+    def __getattr__(self, name):
+        return getattr(self.__dict__['page'], name)
+
+    def __iter__(self):
+        return iter(self.children)
+
+    def __repr__(self):
+        return '<MenuNode: %s>' % self.page
+
+    @property
+    def url(self):
+        return self.page.get_absolute_url()
+
+def build_menu(root, get_children, trail_ids=(), current_id=None):
+    """
+    Nested MenuNodes below root, of any depth.
+    get_children(pk) returns the ordered child pages, trail_ids flags the active trail.
+    """
+    def build(page, depth):
+        node = MenuNode(page, depth, page.pk in trail_ids, page.pk == current_id)
+        node.children = [build(child, depth + 1) for child in get_children(page.pk)]
+        return node
+    return build(root, 0)
+
+def menu_trail(menu):
+    """ Nodes along the active trail, starting at the root """
+    trail = []
+    node = menu
+    while node:
+        trail.append(node)
+        node = next((child for child in node.children if child.active), None)
+    return trail
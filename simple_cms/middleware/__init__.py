@@ -1,13 +1,56 @@
+import logging
+
+from simple_cms import instrumentation
+from simple_cms.cache import get_navigation_tree, get_site_for_host, get_stats, navigation_cache_enabled
+from simple_cms.context_processors import NavigationHelper
 from simple_cms.models import Navigation
+from simple_cms.registry import registry
 from simple_cms.views import NavigationView
+from django.contrib.sites.requests import RequestSite
 from django.http import Http404
 from django.conf import settings
 from functools import update_wrapper
 
+def path_filter_enabled():
+    """
+    SIMPLE_CMS_PATH_FILTER if set. Otherwise on with the navigation cache, unless the
+    SIMPLE_CMS_CONTEXT_PROCESSOR helper finds pages its own way, which may match other urls.
+    """
+    if hasattr(settings, 'SIMPLE_CMS_PATH_FILTER'):
+        return settings.SIMPLE_CMS_PATH_FILTER
+    if not navigation_cache_enabled():
+        return False
+    helper_class = registry.get_helper_class()
+    if not issubclass(helper_class, NavigationHelper):
+        return False
+    return all([getattr(helper_class, name) == getattr(NavigationHelper, name) for name in ('find_page', 'is_homepage')])
+
+def is_routable(request):
+    """
+    Cheap check against the cached navigation paths before dispatching to NavigationView,
+    see path_filter_enabled.
+    """
+    if not path_filter_enabled():
+        return True
+    if request.GET.get('admin_preview'):
+        return True
+    site_id = None
+    if getattr(settings, 'SIMPLE_CMS_CHECK_DOMAIN', False):
+        site = get_site_for_host(RequestSite(request).domain)
+        if site:
+            site_id = site.pk
+    return request.META['PATH_INFO'].strip('/') in get_navigation_tree(site_id).routable_paths
+
 class NavigationMiddleware(object):
     def process_response(self, request, response):
         if response.status_code != 404:
             return response
+        # hits count the 404s answered without dispatching
+        stats = get_stats('path_filter')
+        if not is_routable(request):
+            stats.hit()
+            return response
+        stats.miss()
         try:
             view = NavigationView().dispatch(request)
             update_wrapper(view, NavigationView, updated=())
@@ -19,3 +62,22 @@ class NavigationMiddleware(object):
             if settings.DEBUG:
                 raise
             return response
+
+logger = logging.getLogger('simple_cms.instrumentation')
+
+class TagTimingMiddleware(object):
+    """
+    Reports the simple_cms template tag timings of each request, see simple_cms.instrumentation.
+    Goes first in the middleware settings so pages rendered by NavigationMiddleware are included.
+    """
+    def process_request(self, request):
+        if instrumentation.instrumentation_enabled():
+            instrumentation.start()
+
+    def process_response(self, request, response):
+        timings = instrumentation.stop()
+        if timings and timings.tags:
+            response['Server-Timing'] = timings.server_timing()
+            logger.info('simple_cms tags for %s: %s', request.path, timings.as_dict(), extra={'simple_cms_tags': timings.as_dict()})
+        return response
+
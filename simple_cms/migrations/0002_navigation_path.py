@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_paths(apps, schema_editor):
+    Navigation = apps.get_model('simple_cms', 'Navigation')
+    pages = dict((pk, (parent_id, slug)) for pk, parent_id, slug in Navigation.objects.values_list('pk', 'parent_id', 'slug'))
+
+    def build_path(pk):
+        parent_id, slug = pages[pk]
+        if parent_id in pages:
+            return '%s/%s' % (build_path(parent_id), slug)
+        return slug
+
+    for pk in pages:
+        Navigation.objects.filter(pk=pk).update(path=build_path(pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='navigation',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Full slug path, maintained on save', max_length=255),
+        ),
+        migrations.RunPython(populate_paths, migrations.RunPython.noop),
+        migrations.AlterIndexTogether(
+            name='navigation',
+            index_together=set([('site', 'path')]),
+        ),
+    ]
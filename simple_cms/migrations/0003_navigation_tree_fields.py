@@ -0,0 +1,55 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_tree_fields(apps, schema_editor):
+    Navigation = apps.get_model('simple_cms', 'Navigation')
+    pages = dict((pk, (parent_id, slug, title)) for pk, parent_id, slug, title in Navigation.objects.values_list('pk', 'parent_id', 'slug', 'title'))
+    computed = {}
+
+    def build_tree_fields(pk):
+        if pk not in computed:
+            parent_id, slug, title = pages[pk]
+            if parent_id in pages:
+                parent = build_tree_fields(parent_id)
+                ancestor_ids = [parent['ancestor_ids'], '%s' % parent_id]
+                computed[pk] = {
+                    'path': '%s/%s' % (parent['path'], slug),
+                    'title_path': '%s/%s' % (parent['title_path'], title),
+                    'ancestor_ids': ','.join([ancestor for ancestor in ancestor_ids if ancestor]),
+                    'depth': parent['depth'] + 1,
+                }
+            else:
+                computed[pk] = {'path': slug, 'title_path': title, 'ancestor_ids': '', 'depth': 0}
+        return computed[pk]
+
+    for pk in pages:
+        Navigation.objects.filter(pk=pk).update(**build_tree_fields(pk))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0002_navigation_path'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='navigation',
+            name='ancestor_ids',
+            field=models.CharField(blank=True, default='', editable=False, max_length=255),
+        ),
+        migrations.AddField(
+            model_name='navigation',
+            name='depth',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='navigation',
+            name='title_path',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.RunPython(populate_tree_fields, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def populate_counts(apps, schema_editor):
+    Article = apps.get_model('simple_cms', 'Article')
+    ArchiveCount = apps.get_model('simple_cms', 'ArchiveCount')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    articles = Article.objects.filter(active=True)
+    counts = []
+    for date in articles.datetimes('post_date', 'year'):
+        counts.append(ArchiveCount(kind='year', key='%s' % date.year, count=articles.filter(post_date__year=date.year).count()))
+    for row in Article.categories.through.objects.filter(article__active=True).values('category_id').annotate(n=models.Count('article_id')):
+        counts.append(ArchiveCount(kind='category', key='%s' % row['category_id'], count=row['n']))
+    content_type = ContentType.objects.filter(app_label='simple_cms', model='article').first()
+    if content_type:
+        tags = TaggedItem.objects.filter(content_type=content_type, object_id__in=articles.values('pk')).values('tag__slug').annotate(n=models.Count('id'))
+        for row in tags:
+            counts.append(ArchiveCount(kind='tag', key=row['tag__slug'], count=row['n']))
+    ArchiveCount.objects.bulk_create(counts)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0004_rendered_html'),
+        ('taggit', '0002_auto_20150616_2121'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ArchiveCount',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('category', 'category'), ('tag', 'tag'), ('year', 'year')], max_length=20)),
+                ('key', models.CharField(max_length=255)),
+                ('count', models.PositiveIntegerField(default=0)),
+            ],
+            options={
+                'ordering': ['kind', 'key'],
+            },
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivecount',
+            unique_together=set([('kind', 'key')]),
+        ),
+        migrations.RunPython(populate_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0005_archivecount'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='article',
+            index_together=set([('post_date', 'id')]),
+        ),
+    ]
@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import DatabaseError, migrations, transaction
+from django.utils.html import strip_tags
+
+# frozen copies of the simple_cms.search tables and documents as of this migration
+POSTGRES_TABLE = 'simple_cms_articlesearch'
+SQLITE_TABLE = 'simple_cms_articlefts'
+
+
+def create_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        config = getattr(settings, 'SIMPLE_CMS_SEARCH_CONFIG', 'english')
+        schema_editor.execute('CREATE TABLE %s (article_id integer PRIMARY KEY, document tsvector NOT NULL)' % POSTGRES_TABLE)
+        schema_editor.execute('CREATE INDEX %s_document ON %s USING GIN (document)' % (POSTGRES_TABLE, POSTGRES_TABLE))
+        sql = ('INSERT INTO ' + POSTGRES_TABLE + ' (article_id, document) VALUES (%s, '
+            'setweight(to_tsvector(%s::regconfig, %s), \'A\') || '
+            'setweight(to_tsvector(%s::regconfig, %s), \'B\') || '
+            'setweight(to_tsvector(%s::regconfig, %s), \'C\'))')
+        params = lambda pk, title, tags, body: [pk, config, title, config, tags, config, body]
+    elif connection.vendor == 'sqlite':
+        try:
+            with transaction.atomic(using=connection.alias):
+                schema_editor.execute("CREATE VIRTUAL TABLE %s USING fts5(title, tags, body, tokenize='porter unicode61')" % SQLITE_TABLE)
+        except DatabaseError:
+            # sqlite built without FTS5, search falls back to DatabaseBackend
+            return
+        sql = 'INSERT INTO ' + SQLITE_TABLE + ' (rowid, title, tags, body) VALUES (%s, %s, %s, %s)'
+        params = lambda pk, title, tags, body: [pk, title, tags, body]
+    else:
+        return
+    Article = apps.get_model('simple_cms', 'Article')
+    ContentType = apps.get_model('contenttypes', 'ContentType')
+    TaggedItem = apps.get_model('taggit', 'TaggedItem')
+    tags = {}
+    content_type = ContentType.objects.db_manager(connection.alias).filter(app_label='simple_cms', model='article').first()
+    if content_type:
+        for object_id, name in TaggedItem.objects.using(connection.alias).filter(content_type=content_type).values_list('object_id', 'tag__name'):
+            tags.setdefault(object_id, []).append(name)
+    with connection.cursor() as cursor:
+        for article in Article.objects.using(connection.alias).filter(active=True).iterator():
+            body = '%s %s' % (strip_tags(article.excerpt), strip_tags(article.html or article.text))
+            cursor.execute(sql, params(article.pk, article.title, ' '.join(tags.get(article.pk, [])), body))
+
+
+def drop_search_index(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor == 'postgresql':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % POSTGRES_TABLE)
+    elif connection.vendor == 'sqlite':
+        schema_editor.execute('DROP TABLE IF EXISTS %s' % SQLITE_TABLE)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0006_article_post_date_index'),
+        ('taggit', '0002_auto_20150616_2121'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
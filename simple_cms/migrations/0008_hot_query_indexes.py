@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0007_article_search_index'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='article',
+            index_together=set([('post_date', 'id'), ('active', 'post_date', 'id')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='navigation',
+            index_together=set([('site', 'path'), ('path', 'active')]),
+        ),
+        migrations.AlterIndexTogether(
+            name='relatedblock',
+            index_together=set([('content_type', 'object_id', 'active', 'group')]),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0008_hot_query_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='article',
+            index_together=set([('post_date', 'id'), ('active', 'post_date', 'id'), ('active', 'publish_start'), ('active', 'publish_end')]),
+        ),
+    ]
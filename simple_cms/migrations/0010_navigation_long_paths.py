@@ -0,0 +1,24 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0009_article_publish_window_indexes'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='navigation',
+            name='ancestor_ids',
+            field=models.TextField(blank=True, default='', editable=False),
+        ),
+        migrations.AlterField(
+            model_name='navigation',
+            name='path',
+            field=models.CharField(blank=True, default='', editable=False, help_text='Full slug path, maintained on save', max_length=1000),
+        ),
+    ]
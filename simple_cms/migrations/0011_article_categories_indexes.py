@@ -0,0 +1,30 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+TABLE = 'simple_cms_article_categories'
+
+
+def create_missing_indexes(apps, schema_editor):
+    # On SQLite, 0001 remade simple_cms_article after adding categories, and Django dropped
+    # every deferred statement mentioning that table name, the through table indexes included
+    connection = schema_editor.connection
+    with connection.cursor() as cursor:
+        constraints = connection.introspection.get_constraints(cursor, TABLE)
+    leading = set([constraint['columns'][0] for constraint in constraints.values() if constraint['index'] and constraint['columns']])
+    for column in ('article_id', 'category_id'):
+        if column not in leading:
+            schema_editor.execute('CREATE INDEX %s ON %s (%s)' % (
+                schema_editor.quote_name('%s_%s' % (TABLE, column)), schema_editor.quote_name(TABLE), schema_editor.quote_name(column)))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('simple_cms', '0010_navigation_long_paths'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_missing_indexes, migrations.RunPython.noop),
+    ]
@@ -1,12 +1,11 @@
-import datetime
-
-from django.db import models
+from django.db import models, transaction
 from django.utils.safestring import mark_safe
 from django.utils.encoding import *
 from django.contrib.contenttypes.models import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey, GenericRelation
 from django.contrib.sites.models import Site
 from django.db.models import Q
+from django.utils import timezone
 
 from django.conf import settings
 
@@ -16,6 +15,9 @@ from django_extensions.db.fields import AutoSlugField
 from taggit.managers import TaggableManager
 from positions.fields import PositionField
 
+from simple_cms import renderers
+from simple_cms.cache import block_cache, get_cache, get_compiled_template, get_navigation_tree, get_publish_window, get_published_key, invalidate_model, navigation_cache_enabled, related_blocks_cache, seo_cache
+
 FORMAT_CHOICES = (
     ('html', 'html'),
     ('markdown', 'markdown'),
@@ -35,14 +37,65 @@ class CommonAbstractManager(models.Manager):
     def get_active(self):
         return self.all().filter(active=True)
 
+class PositionManager(CommonAbstractManager):
+
+    @transaction.atomic
+    def reorder(self, ids, **collection):
+        """
+        Set the order of a whole collection at once, eg.
+        Navigation.objects.reorder([3, 1, 2], parent=None, site=site)
+        Writes every position with one UPDATE instead of PositionField shifting siblings on each save.
+        """
+        field = self.model._meta.get_field('order')
+        if set(collection) != set(field.collection):
+            raise ValueError('reorder needs exactly the collection fields %s' % ', '.join(field.collection))
+        ids = [int(pk) for pk in ids]
+        queryset = self.filter(**collection)
+        existing = set(queryset.select_for_update().values_list('pk', flat=True))
+        if len(ids) != len(existing) or set(ids) != existing:
+            raise ValueError('reorder needs the ids of every row in the collection')
+        if ids:
+            order = models.Case(*[models.When(pk=pk, then=models.Value(i)) for i, pk in enumerate(ids)], output_field=models.IntegerField())
+            queryset.update(order=order, updated_at=timezone.now())
+        # update() skips the save signals, one invalidation covers the whole collection
+        transaction.on_commit(lambda: invalidate_model(self.model))
+
 class TextMixin(object):
+    """
+    Text in one of FORMAT_CHOICES. Unless it is rendered as a template,
+    the html is rendered on save and stored in html, see simple_cms.renderers.
+    """
+    def save(self, *args, **kwargs):
+        self.render_html()
+        super(TextMixin, self).save(*args, **kwargs)
+
+    def render_html(self):
+        if self.render_as_template:
+            self.html, self.html_renderer = '', ''
+        else:
+            self.html, self.html_renderer = renderers.render(self.format, self.text)
+
     def get_text_block(self):
         return {
             'text': self.text,
             'format': self.format,
             'render_as_template': self.render_as_template,
+            'template': self.get_text_template(),
+            'html': self.get_html(),
         }
 
+    def get_html(self):
+        """ Stored html, None if the text has to be rendered by the template """
+        if self.html_renderer:
+            return mark_safe(self.html)
+        return None
+
+    def get_text_template(self):
+        """ Compiled template of the text when it is rendered as a template, shared through the template cache """
+        if self.render_as_template:
+            return get_compiled_template(self.text)
+        return None
+
 class UrlMixin(object):
     @property
     def link_attributes(self):
@@ -72,6 +125,40 @@ class CommonAbstractModel(models.Model):
     def get_class_name(self):
         return self.__class__.__name__
 
+class SeoManager(models.Manager):
+
+    def get_for_objects(self, objects):
+        """ Seo of each object (or None), keyed by (content_type_id, object_id), loaded with at most one query """
+        keys = [(ContentType.objects.get_for_model(obj).pk, obj.pk) for obj in objects]
+        return seo_cache.get_many(keys, self._fetch)
+
+    def get_for_object(self, obj):
+        return self.get_for_objects([obj])[(ContentType.objects.get_for_model(obj).pk, obj.pk)]
+
+    def prefetch(self, objects):
+        """ Evaluate objects into a list, attaching their Seo for get_seo() """
+        objects = list(objects)
+        seo = self.get_for_objects(objects)
+        for obj in objects:
+            obj._seo = seo[(ContentType.objects.get_for_model(obj).pk, obj.pk)]
+        return objects
+
+    def _fetch(self, keys):
+        object_ids = {}
+        for content_type_id, object_id in keys:
+            object_ids.setdefault(content_type_id, []).append(object_id)
+        q = Q()
+        for content_type_id, ids in object_ids.items():
+            q |= Q(content_type_id=content_type_id, object_id__in=ids)
+        return dict(((seo.content_type_id, seo.object_id), seo) for seo in self.filter(q))
+
+class SeoMixin(object):
+    def get_seo(self):
+        # not memoized on the instance, navigation pages are shared by the navigation cache
+        if hasattr(self, '_seo'):
+            return self._seo
+        return Seo.objects.get_for_object(self)
+
 class Seo(models.Model):
     title = models.CharField(max_length=255, blank=True, default='', help_text='Complete html title replacement')
     description = models.TextField(blank=True, default='')
@@ -79,6 +166,7 @@ class Seo(models.Model):
     content_type = models.ForeignKey(ContentType)
     object_id = models.PositiveIntegerField()
     content_object = GenericForeignKey('content_type', 'object_id')
+    objects = SeoManager()
 
     class Meta:
         unique_together = ['content_type', 'object_id']
@@ -96,16 +184,32 @@ class BlockGroup(models.Model):
     def __str__(self):
         return '%s' % self.title
 
+class BlockManager(CommonAbstractManager):
+
+    def get_cached(self, key):
+        """ Active block for key or None, served from the process wide block cache """
+        return block_cache.get(key, self._fetch)
+
+    def get_cached_many(self, keys):
+        """ Active blocks for all keys (None for misses) keyed by key, the uncached ones fetched in one query """
+        return block_cache.get_many(keys, self._fetch)
+
+    def _fetch(self, keys):
+        return dict((block.key, block) for block in self.get_active().filter(key__in=keys))
+
 class Block(TextMixin, UrlMixin, CommonAbstractModel):
     key = models.CharField(max_length=255, unique=True, help_text='Internal name to refer to this item')
     title = models.CharField(max_length=255, blank=True, help_text='Optional header on sidebar')
     text = models.TextField(blank=True, default='')
     format = models.CharField(max_length=255, blank=True, default='', choices=FORMAT_CHOICES)
     render_as_template = models.BooleanField(default=False)
+    html = models.TextField(blank=True, default='', editable=False)
+    html_renderer = models.CharField(max_length=255, blank=True, default='', editable=False)
     image = models.ImageField(upload_to='uploads/contentblocks/', blank=True, default='', help_text='Optional image')
     url = models.CharField(max_length=255, blank=True, default='', help_text='eg. link image / title somewhere http://awesome.com/ or /awesome/page/')
     target = models.CharField(max_length=255, blank=True, default='', help_text='eg. open image / title link in "_blank" window', choices=TARGET_CHOICES)
     bypass_layout = models.BooleanField(default=False, help_text='Render only text field content, no surrounding markup.')
+    objects = BlockManager()
 
     # consider ditching these - NOW
     content_type = models.ForeignKey(ContentType, blank=True, null=True, help_text="""Choose an existing item type.<br>The most common choices will be Expert, etc.""")
@@ -115,6 +219,45 @@ class Block(TextMixin, UrlMixin, CommonAbstractModel):
     def __str_(self):
         return '%s' % (self.key)
 
+class RelatedBlockManager(PositionManager):
+
+    def get_blocks(self, instance, group=None):
+        """
+        Active blocks of instance followed by the ones it inherits from its parents,
+        see Navigation.inherit_blocks, optionally limited to a BlockGroup title.
+        Resolved with one query and cached until a block, group or page changes.
+        """
+        content_type = ContentType.objects.get_for_model(instance)
+        key = (content_type.pk, instance.pk, group)
+        return related_blocks_cache.get(key, lambda keys: {key: self._resolve_blocks(instance, content_type, group)})
+
+    def _inheritance_chain(self, instance):
+        """ Ids of instance and the parents it inherits blocks from, nearest first """
+        chain = [instance.pk]
+        if not getattr(instance, 'inherit_blocks', False) or not hasattr(instance, 'get_ancestor_ids'):
+            return chain
+        ancestor_ids = instance.get_ancestor_ids()
+        pages = {}
+        if navigation_cache_enabled():
+            tree = get_navigation_tree(instance.site_id)
+            pages = dict((pk, tree.get(pk).inherit_blocks) for pk in ancestor_ids if tree.get(pk))
+        if len(pages) != len(ancestor_ids):
+            pages = dict(instance.__class__.objects.filter(pk__in=ancestor_ids).values_list('pk', 'inherit_blocks'))
+        for pk in reversed(ancestor_ids):
+            chain.append(pk)
+            if not pages.get(pk):
+                break
+        return chain
+
+    def _resolve_blocks(self, instance, content_type, group=None):
+        chain = self._inheritance_chain(instance)
+        kwargs = {'content_type': content_type, 'object_id__in': chain, 'active': True}
+        if group is not None:
+            kwargs['group__title'] = group
+        position = dict((pk, i) for i, pk in enumerate(chain))
+        related = sorted(self.filter(**kwargs).select_related('block').order_by('order'), key=lambda r: position[r.object_id])
+        return [r.block for r in related]
+
 class RelatedBlock(CommonAbstractModel):
     """ Linking Blocks to any object """
     content_type = models.ForeignKey(ContentType)
@@ -123,6 +266,7 @@ class RelatedBlock(CommonAbstractModel):
     block = models.ForeignKey('simple_cms.Block')
     group = models.ForeignKey('simple_cms.BlockGroup', blank=True, null=True)
     order = PositionField(collection=('content_type', 'object_id', 'group'))
+    objects = RelatedBlockManager()
     """ Because of the crummy status of the PositionField among other complications
     (leaving the content_type null and PositionField collection dependency)
     it is necessary to maintain a separate model for arbitrary grouping of blocks,
@@ -133,10 +277,48 @@ class RelatedBlock(CommonAbstractModel):
 
     class Meta:
         ordering = ['order', ]
+        index_together = (('content_type', 'object_id', 'active', 'group'),)
 
     def __str__(self):
         return '%s - %s' % (self.content_object, self.block)
 
+TREE_FIELDS = ('path', 'title_path', 'ancestor_ids', 'depth')
+# still indexed, so bounded, Navigation.clean() keeps pages and their descendants within it
+PATH_MAX_LENGTH = 1000
+
+def build_tree_fields(parent, slug, title):
+    """
+    Denormalized tree fields for a Navigation page.
+    parent is a dict of the parent's pk and tree fields, or None for a root page.
+    """
+    if not parent:
+        return {'path': slug, 'title_path': title, 'ancestor_ids': '', 'depth': 0}
+    ancestor_ids = [parent['ancestor_ids'], '%s' % parent['pk']]
+    return {
+        'path': '%s/%s' % (parent['path'], slug),
+        'title_path': '%s/%s' % (parent['title_path'], title),
+        'ancestor_ids': ','.join([pk for pk in ancestor_ids if pk]),
+        'depth': parent['depth'] + 1,
+    }
+
+def compute_tree_fields(rows):
+    """ Tree fields for every (pk, parent_id, slug, title) row, keyed by pk """
+    rows = dict((row[0], row) for row in rows)
+    computed = {}
+
+    def compute(pk):
+        if pk not in computed:
+            parent_id, slug, title = rows[pk][1:]
+            parent = None
+            if parent_id in rows:
+                parent = dict(compute(parent_id), pk=parent_id)
+            computed[pk] = build_tree_fields(parent, slug, title)
+        return computed[pk]
+
+    for pk in rows:
+        compute(pk)
+    return computed
+
 class NavigationGroup(models.Model):
     title = models.CharField(max_length=255)
 
@@ -146,13 +328,17 @@ class NavigationGroup(models.Model):
     def __str__(self):
         return '%s' % self.title
 
-class Navigation(TextMixin, CommonAbstractModel):
+class Navigation(TextMixin, SeoMixin, CommonAbstractModel):
     """
     Navigation and Page combined model
     Customizations on One-To-One in implementing app
     """
     title = models.CharField(max_length=255, help_text='Navigation and default page title')
     slug = AutoSlugField(editable=True, populate_from='title')
+    path = models.CharField(max_length=PATH_MAX_LENGTH, blank=True, default='', editable=False, help_text='Full slug path, maintained on save')
+    title_path = models.TextField(blank=True, default='', editable=False)
+    ancestor_ids = models.TextField(blank=True, default='', editable=False)
+    depth = models.PositiveIntegerField(default=0, editable=False)
     group = models.ForeignKey(NavigationGroup, blank=True, null=True)
     parent = models.ForeignKey('self', blank=True, null=True, related_name='children')
     order = PositionField(collection=('parent', 'site'))
@@ -166,27 +352,87 @@ class Navigation(TextMixin, CommonAbstractModel):
     text = models.TextField(blank=True, default='')
     format = models.CharField(max_length=255, blank=True, default='', choices=FORMAT_CHOICES)
     render_as_template = models.BooleanField(default=False)
+    html = models.TextField(blank=True, default='', editable=False)
+    html_renderer = models.CharField(max_length=255, blank=True, default='', editable=False)
     template = models.CharField(max_length=255, blank=True, default='', help_text='Eg. common/awesome.html')
     view = models.CharField(max_length=255, blank=True, default='', help_text='Eg. common.views.awesome')
     redirect_url = models.CharField(max_length=255, blank=True, default='')
     redirect_permanent = models.BooleanField(default=False)
     inherit_blocks = models.BooleanField(default=True, verbose_name="Inherit Blocks")
     inherit_template = models.BooleanField(default=False, verbose_name="Inherit Template")
+    objects = PositionManager()
     seo = GenericRelation(Seo)
     blocks = GenericRelation(RelatedBlock)
 
     class Meta:
         unique_together = (('site', 'slug', 'parent'),)
+        index_together = (('site', 'path'), ('path', 'active'))
         ordering = ['title']
         verbose_name_plural = 'Navigation'
 
     def __str__(self):
         return '%s' % self._chain()
 
+    @transaction.atomic
+    def save(self, *args, **kwargs):
+        adding = self._state.adding
+        super(Navigation, self).save(*args, **kwargs)
+        # slug may only be filled in by AutoSlugField during the save, so build the tree fields afterwards
+        parent = None
+        if self.parent:
+            parent = self.parent.get_tree_fields()
+        fields = build_tree_fields(parent, self.slug, self.title)
+        if [getattr(self, name) for name in TREE_FIELDS] != [fields[name] for name in TREE_FIELDS]:
+            Navigation.objects.filter(pk=self.pk).update(**fields)
+            for name, value in fields.items():
+                setattr(self, name, value)
+            if not adding:
+                self.update_descendants()
+
+    def get_tree_fields(self):
+        fields = dict((name, getattr(self, name)) for name in TREE_FIELDS)
+        fields['pk'] = self.pk
+        return fields
+
+    def update_descendants(self):
+        """ Rewrite the stored tree fields of every page below this one, eg. after a rename or move. """
+        stack = [self.get_tree_fields()]
+        # a parent cycle saved without clean() would otherwise be walked forever
+        visited = set([self.pk])
+        while stack:
+            parent = stack.pop()
+            for pk, slug, title in Navigation.objects.filter(parent_id=parent['pk']).values_list('pk', 'slug', 'title'):
+                if pk in visited:
+                    continue
+                visited.add(pk)
+                fields = build_tree_fields(parent, slug, title)
+                Navigation.objects.filter(pk=pk).update(**fields)
+                fields['pk'] = pk
+                stack.append(fields)
+
+    def get_ancestor_ids(self):
+        """ Ids of the parent pages, starting at the root """
+        if self.ancestor_ids:
+            return [int(pk) for pk in self.ancestor_ids.split(',')]
+        return []
+
     def clean(self):
         from django.core.exceptions import ValidationError
+        from django.utils.text import slugify
         if self.parent == self:
             raise ValidationError('Can\'t set parent to self.')
+        if self.pk and self.parent and self.pk in self.parent.get_ancestor_ids():
+            raise ValidationError('Can\'t move a page below one of its own subpages.')
+        path = self.slug or slugify(self.title)
+        if self.parent:
+            path = '%s/%s' % (self.parent.path, path)
+        longest = len(path)
+        if self.pk and self.path:
+            # descendants keep their path below this page, so a move or rename changes their length too
+            suffixes = Navigation.objects.filter(site_id=self.site_id, path__startswith='%s/' % self.path).values_list('path', flat=True)
+            longest += max([len(descendant) - len(self.path) for descendant in suffixes] or [0])
+        if longest > PATH_MAX_LENGTH:
+            raise ValidationError('The url of this page or one below it would be longer than %s characters.' % PATH_MAX_LENGTH)
 
     def num_blocks(self):
         l = len(self.blocks.all())
@@ -209,10 +455,14 @@ class Navigation(TextMixin, CommonAbstractModel):
     custom_view.admin_order_field = 'view'
 
     def root(self):
-        item = self
-        while item.parent:
-            item = item.parent
-        return item
+        ancestor_ids = self.get_ancestor_ids()
+        if not ancestor_ids:
+            return self
+        if navigation_cache_enabled():
+            root = get_navigation_tree(self.site_id).get(ancestor_ids[0])
+            if root:
+                return root
+        return Navigation.objects.get(pk=ancestor_ids[0])
 
     def get_title(self):
         if self.page_title:
@@ -221,6 +471,10 @@ class Navigation(TextMixin, CommonAbstractModel):
 
     def _chain(self, prop='title'):
         """ Create slug chain for an object and its parent(s). """
+        if prop == 'slug' and self.path:
+            return self.path
+        if prop == 'title' and self.title_path:
+            return self.title_path
         item = self
         tA = [getattr(item, prop)]
         while item.parent:
@@ -237,6 +491,10 @@ class Navigation(TextMixin, CommonAbstractModel):
         return mark_safe('/%s/' % self._chain('slug'))
 
     def get_children(self):
+        if hasattr(self, '_tree_children'):
+            return self._tree_children
+        if navigation_cache_enabled():
+            return get_navigation_tree(self.site_id).get_children(self.pk)
         return self.children.all().filter(active=True).order_by('order')
 
     @property
@@ -254,17 +512,6 @@ class Navigation(TextMixin, CommonAbstractModel):
     def link_attributes(self):
         return self.href
 
-    @property
-    def depth(self):
-        depth = 0
-        item = self
-        while item.parent:
-            item = item.parent
-            depth += 1
-        else:
-            pass
-        return depth
-
     @property
     def search_description(self):
         return self.text
@@ -287,9 +534,45 @@ class Category(CommonAbstractModel):
 class PublishedManager(CommonAbstractManager):
 
     def get_published(self):
-        return self.get_active().filter(Q(publish_start__lte=datetime.datetime.now(), publish_end=None) | Q(publish_start__lte=datetime.datetime.now(), publish_end__gte=datetime.datetime.now()))
-
-class Article(TextMixin, UrlMixin, CommonAbstractModel):
+        """
+        Active articles inside their publish window, evaluated at the start of the current PublishWindow.
+        A queryset like any other, its SQL stays the same until the window ends, get_published_ids is the cached set.
+        """
+        now = get_publish_window().now
+        return self.get_active().filter(Q(publish_start__lte=now, publish_end=None) | Q(publish_start__lte=now, publish_end__gte=now))
+
+    def get_published_ids(self):
+        """ Ids of the published articles newest first, kept in the shared cache until the next publish transition or article change """
+        window = get_publish_window()
+        cache = get_cache()
+        key = get_published_key(window)
+        ids = cache.get(key)
+        if ids is None:
+            ids = list(self.get_published().order_by('-post_date', '-pk').values_list('pk', flat=True))
+            cache.set(key, ids, None)
+        return ids
+
+    def get_adjacent(self, article, queryset=None):
+        """
+        (previous, next) articles around article in -post_date order, previous being the older one.
+        Looked up in get_published_ids unless queryset is given, else keyset lookups on (post_date, id) against queryset.
+        """
+        if queryset is None:
+            ids = self.get_published_ids()
+            if article.pk in ids:
+                i = ids.index(article.pk)
+                previous_pk = ids[i + 1] if i + 1 < len(ids) else None
+                next_pk = ids[i - 1] if i else None
+                articles = self.in_bulk([pk for pk in (previous_pk, next_pk) if pk is not None])
+                return articles.get(previous_pk), articles.get(next_pk)
+            queryset = self.get_published()
+        older = Q(post_date__lt=article.post_date) | Q(post_date=article.post_date, pk__lt=article.pk)
+        newer = Q(post_date__gt=article.post_date) | Q(post_date=article.post_date, pk__gt=article.pk)
+        previous_article = queryset.filter(older).order_by('-post_date', '-pk').first()
+        next_article = queryset.filter(newer).order_by('post_date', 'pk').first()
+        return previous_article, next_article
+
+class Article(TextMixin, UrlMixin, SeoMixin, CommonAbstractModel):
     title = models.CharField(max_length=255)
     slug = AutoSlugField(editable=True, populate_from='title')
     # default to now
@@ -297,6 +580,8 @@ class Article(TextMixin, UrlMixin, CommonAbstractModel):
     text = models.TextField(blank=True, default='')
     format = models.CharField(max_length=255, blank=True, default='', choices=FORMAT_CHOICES)
     render_as_template = models.BooleanField(default=False)
+    html = models.TextField(blank=True, default='', editable=False)
+    html_renderer = models.CharField(max_length=255, blank=True, default='', editable=False)
     excerpt = models.TextField(blank=True, default='')
     key_image = models.ImageField(upload_to='uploads/blog/', blank=True, default='')
     display_image = models.BooleanField(default=True, blank=True, help_text='Display image on post detail?')
@@ -319,6 +604,7 @@ class Article(TextMixin, UrlMixin, CommonAbstractModel):
 
     class Meta:
         ordering = ['-post_date']
+        index_together = (('post_date', 'id'), ('active', 'post_date', 'id'), ('active', 'publish_start'), ('active', 'publish_end'))
 
     def __str__(self):
         return '%s' % self.title
@@ -336,6 +622,82 @@ class Article(TextMixin, UrlMixin, CommonAbstractModel):
             return 'target="%s"' % self.target
         return ''
 
+class ArchiveCountManager(models.Manager):
+
+    def get_count(self, kind, *keys):
+        return self.filter(kind=kind, key__in=['%s' % key for key in keys]).aggregate(total=models.Sum('count'))['total'] or 0
+
+    def get_keys(self, kind):
+        """ Keys of kind with at least one published article """
+        return list(self.filter(kind=kind, count__gt=0).values_list('key', flat=True))
+
+    def get_year(self, post_date):
+        """ Year of post_date in the current time zone, matching post_date__year and dates() """
+        if settings.USE_TZ and timezone.is_aware(post_date):
+            post_date = timezone.localtime(post_date)
+        return '%s' % post_date.year
+
+    def article_keys(self, article):
+        """ (kind, key) of every counter an article contributes to """
+        keys = [('year', self.get_year(article.post_date))]
+        keys.extend([('category', '%s' % pk) for pk in article.categories.values_list('pk', flat=True)])
+        keys.extend([('tag', slug) for slug in article.tags.values_list('slug', flat=True)])
+        return keys
+
+    def count_published(self, kind, key):
+        articles = Article.objects.get_active()
+        if kind == 'year':
+            return articles.filter(post_date__year=int(key)).count()
+        if kind == 'category':
+            return articles.filter(categories__pk=int(key)).count()
+        return articles.filter(tags__slug=key).count()
+
+    def recount(self, keys):
+        """ Recount the published articles of the given (kind, key) pairs """
+        for kind, key in set(keys):
+            self.update_or_create(kind=kind, key=key, defaults={'count': self.count_published(kind, key)})
+
+    @transaction.atomic
+    def rebuild(self):
+        """ Recount everything, eg. for existing data or after a queryset.update() on articles """
+        articles = Article.objects.get_active()
+        counts = []
+        # datetimes(), unlike dates(), truncates in the current time zone like post_date__year
+        for date in articles.datetimes('post_date', 'year'):
+            counts.append(ArchiveCount(kind='year', key=self.get_year(date), count=articles.filter(post_date__year=date.year).count()))
+        categories = Article.categories.through.objects.filter(article__active=True).values('category_id').annotate(n=models.Count('article_id'))
+        counts.extend([ArchiveCount(kind='category', key='%s' % row['category_id'], count=row['n']) for row in categories])
+        tags = Article.tags.through.objects.filter(
+            content_type=ContentType.objects.get_for_model(Article),
+            object_id__in=articles.values('pk'),
+        ).values('tag__slug').annotate(n=models.Count('id'))
+        counts.extend([ArchiveCount(kind='tag', key=row['tag__slug'], count=row['n']) for row in tags])
+        self.all().delete()
+        self.bulk_create(counts)
+        return counts
+
+class ArchiveCount(models.Model):
+    """
+    Number of published (active) articles per category id, tag slug or post_date year,
+    kept current by the signal handlers in simple_cms.signals.
+    """
+    KIND_CHOICES = (
+        ('category', 'category'),
+        ('tag', 'tag'),
+        ('year', 'year'),
+    )
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    key = models.CharField(max_length=255)
+    count = models.PositiveIntegerField(default=0)
+    objects = ArchiveCountManager()
+
+    class Meta:
+        unique_together = (('kind', 'key'),)
+        ordering = ['kind', 'key']
+
+    def __str__(self):
+        return '%s %s: %s' % (self.kind, self.key, self.count)
+
 """
 class Venue(CommonAbstractModel):
     name = models.CharField(max_length=255)
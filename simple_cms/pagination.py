@@ -0,0 +1,271 @@
+"""
+Keyset (cursor) pagination for list views.
+
+Pages after the first are found with a WHERE on the ordering columns, eg.
+(post_date, id) < (last post_date, last id), instead of an OFFSET, so deep pages
+of a large archive cost the same as the first. Cursors are signed tokens.
+Page numbers still work for jumping straight to a page, eg. digg_paginator links,
+at the price of an OFFSET for that one page.
+"""
+import json
+import math
+
+from django.core import signing
+from django.core.paginator import InvalidPage
+from django.db import connections
+from django.db.models import Q
+from django.db.models.query import QuerySet
+from django.http import Http404, JsonResponse
+from django.utils.functional import cached_property
+
+class InvalidCursor(InvalidPage):
+    pass
+
+def serialize(value):
+    if hasattr(value, 'isoformat'):
+        return value.isoformat()
+    if value is None or isinstance(value, (bool, int, float)):
+        return value
+    return '%s' % value
+
+def estimate_count(queryset):
+    """ Row estimate of the PostgreSQL planner, an exact count on other databases """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return queryset.count()
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+        plan = cursor.fetchone()[0]
+    if not isinstance(plan, list):
+        plan = json.loads(plan)
+    return int(plan[0]['Plan']['Plan Rows'])
+
+class CursorPage(object):
+    """ Quacks like django.core.paginator.Page, plus next_cursor and previous_cursor """
+
+    def __init__(self, object_list, number, paginator, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.number = number
+        self.paginator = paginator
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    def __repr__(self):
+        return '<Page %s>' % self.number
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def has_next(self):
+        return self.next_cursor is not None
+
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def has_other_pages(self):
+        return self.has_next() or self.has_previous()
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+class CursorPaginator(object):
+    """
+    Paginates a queryset by its ordering fields, ('-post_date', '-pk') unless given.
+    The last field has to be unique. count is 'exact', 'estimate' (see estimate_count)
+    or None to skip counting, leaving count None and num_pages 0.
+    Anything that is not a queryset, eg. search results, is paged by position instead.
+    """
+    salt = 'simple_cms.pagination'
+
+    def __init__(self, object_list, per_page, ordering=('-post_date', '-pk'), count='exact'):
+        self.keyset = isinstance(object_list, QuerySet)
+        if self.keyset:
+            object_list = object_list.order_by(*ordering)
+        self.object_list = object_list
+        self.per_page = int(per_page)
+        self.ordering = tuple(ordering)
+        self.count_mode = count
+
+    @cached_property
+    def count(self):
+        if not self.keyset:
+            return len(self.object_list)
+        if self.count_mode == 'estimate':
+            return estimate_count(self.object_list)
+        if self.count_mode:
+            return self.object_list.count()
+        return None
+
+    @property
+    def num_pages(self):
+        if self.count is None:
+            return 0
+        return max(1, int(math.ceil(self.count / float(self.per_page))))
+
+    @property
+    def page_range(self):
+        return range(1, self.num_pages + 1)
+
+    def encode(self, data):
+        data['o'] = list(self.ordering)
+        return signing.dumps(data, salt=self.salt, compress=True)
+
+    def decode(self, cursor):
+        """ Cursor data, which has to come from a paginator with the same ordering """
+        try:
+            data = signing.loads(cursor, salt=self.salt)
+        except signing.BadSignature:
+            raise InvalidCursor('Invalid cursor')
+        if data.get('o') != list(self.ordering):
+            raise InvalidCursor('That cursor is for another ordering')
+        return data
+
+    def get_value(self, obj, field):
+        """ Value of an ordering field, following '__' lookups through related objects """
+        value = obj
+        for name in field.lstrip('-').split('__'):
+            if value is None:
+                break
+            try:
+                value = getattr(value, name)
+            except AttributeError:
+                raise InvalidCursor('Can not page by %s' % field)
+        return value
+
+    def get_key(self, obj):
+        return [serialize(self.get_value(obj, field)) for field in self.ordering]
+
+    def field_after(self, name, value, descending):
+        """
+        Q for the values of one field sorting after value, None if nothing does.
+        NULLs go where the database sorts them, last ascending on PostgreSQL, first on SQLite and MySQL.
+        """
+        nulls_largest = connections[self.object_list.db].features.nulls_order_largest
+        if value is None:
+            if nulls_largest == descending:
+                return Q(**{'%s__isnull' % name: False})
+            return None
+        condition = Q(**{'%s__%s' % (name, 'lt' if descending else 'gt'): value})
+        if nulls_largest != descending:
+            condition |= Q(**{'%s__isnull' % name: True})
+        return condition
+
+    def after(self, key, reverse=False):
+        """ Q for the rows following key in the ordering, or preceding it if reverse """
+        conditions = []
+        for i, field in enumerate(self.ordering):
+            condition = self.field_after(field.lstrip('-'), key[i], field.startswith('-') != reverse)
+            if condition is None:
+                continue
+            for previous, value in zip(self.ordering[:i], key[:i]):
+                # an exact None filter is an isnull lookup
+                condition &= Q(**{previous.lstrip('-'): value})
+            conditions.append(condition)
+        if not conditions:
+            return Q(pk__in=[])
+        q = conditions[0]
+        for condition in conditions[1:]:
+            q |= condition
+        return q
+
+    def page(self, cursor=None, number=1):
+        """ Page at cursor, or at page number when there is no cursor """
+        if not self.keyset:
+            return self.position_page(cursor, number)
+        number = int(number)
+        if number < 1:
+            raise InvalidCursor('That page number is less than 1')
+        previous = False
+        if cursor:
+            data = self.decode(cursor)
+            number = data['n']
+            previous = data.get('p', False)
+            if previous:
+                reverse_ordering = [field[1:] if field.startswith('-') else '-%s' % field for field in self.ordering]
+                queryset = self.object_list.filter(self.after(data['k'], reverse=True)).order_by(*reverse_ordering)
+            else:
+                queryset = self.object_list.filter(self.after(data['k']))
+            rows = list(queryset[:self.per_page + 1])
+        else:
+            offset = (number - 1) * self.per_page
+            rows = list(self.object_list[offset:offset + self.per_page + 1])
+            if not rows and number > 1:
+                raise InvalidCursor('That page contains no results')
+        more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+        if previous:
+            rows.reverse()
+            has_next, has_previous = True, more
+        else:
+            has_next, has_previous = more, number > 1 or bool(cursor)
+        next_cursor = previous_cursor = None
+        if rows and has_next:
+            next_cursor = self.encode({'k': self.get_key(rows[-1]), 'n': number + 1})
+        if rows and has_previous:
+            previous_cursor = self.encode({'k': self.get_key(rows[0]), 'p': True, 'n': max(1, number - 1)})
+        return CursorPage(rows, number, self, next_cursor, previous_cursor)
+
+    def position_page(self, cursor=None, number=1):
+        if cursor:
+            number = self.decode(cursor)['n']
+        number = int(number)
+        if number < 1 or (number > 1 and number > self.num_pages):
+            raise InvalidCursor('That page contains no results')
+        offset = (number - 1) * self.per_page
+        rows = list(self.object_list[offset:offset + self.per_page])
+        next_cursor = previous_cursor = None
+        if offset + self.per_page < self.count:
+            next_cursor = self.encode({'n': number + 1})
+        if number > 1:
+            previous_cursor = self.encode({'n': number - 1})
+        return CursorPage(rows, number, self, next_cursor, previous_cursor)
+
+class CursorPaginationMixin(object):
+    """
+    Opt-in cursor paging for a ListView with paginate_by, set cursor_pagination = True
+    or pass it to as_view(). Follow ?cursor=<page_obj.next_cursor>, ?page=<number> still works.
+    cursor_count is passed on to CursorPaginator as count.
+    ?format=json returns the page as JSON, eg. for infinite scroll.
+    """
+    cursor_pagination = False
+    cursor_ordering = ('-post_date', '-pk')
+    cursor_count = 'exact'
+    json_fields = ('id', 'title', 'slug', 'post_date', 'excerpt', 'url')
+
+    def get_cursor_ordering(self):
+        return self.cursor_ordering
+
+    def paginate_queryset(self, queryset, page_size):
+        if not self.cursor_pagination:
+            return super(CursorPaginationMixin, self).paginate_queryset(queryset, page_size)
+        paginator = CursorPaginator(queryset, page_size, self.get_cursor_ordering(), self.cursor_count)
+        try:
+            page = paginator.page(self.request.GET.get('cursor'), self.request.GET.get(self.page_kwarg) or 1)
+        except (InvalidPage, ValueError, KeyError):
+            raise Http404('Invalid page')
+        return (paginator, page, page.object_list, page.has_other_pages())
+
+    def get_json_object(self, obj):
+        return dict((field, getattr(obj, field, None)) for field in self.json_fields)
+
+    def render_to_response(self, context, **response_kwargs):
+        if not self.cursor_pagination or self.request.GET.get('format') != 'json':
+            return super(CursorPaginationMixin, self).render_to_response(context, **response_kwargs)
+        page = context.get('page_obj')
+        object_list = context['object_list']
+        return JsonResponse({
+            'objects': [self.get_json_object(obj) for obj in object_list],
+            'next': page.next_cursor if page else None,
+            'previous': page.previous_cursor if page else None,
+            'count': page.paginator.count if page else len(object_list),
+        })
@@ -0,0 +1,76 @@
+"""
+Import-once registry for everything simple_cms resolves from dotted paths or template names:
+the SIMPLE_CMS_CONTEXT_PROCESSOR helper class and the view and template of each Navigation page.
+"""
+from django.conf import settings
+from django.core.urlresolvers import get_callable
+from django.template import loader
+from django.utils.module_loading import import_string
+
+class Registry(object):
+
+    def __init__(self):
+        self.helper_class = None
+        self.views = {}
+        self.templates = {}
+        self.preloaded = False
+
+    def load(self):
+        """ Called from AppConfig.ready() """
+        from simple_cms.context_processors import NavigationHelper
+        try:
+            self.helper_class = import_string(settings.SIMPLE_CMS_CONTEXT_PROCESSOR)
+        except (AttributeError, ImportError):
+            self.helper_class = NavigationHelper
+
+    def get_helper_class(self):
+        if self.helper_class is None:
+            self.load()
+        return self.helper_class
+
+    def get_view(self, path):
+        """ Callable for a Navigation.view, None for class based '.as_view(' entries which are rendered as pages """
+        try:
+            return self.views[path]
+        except KeyError:
+            pass
+        view = None
+        if path.find('.as_view(') == -1:
+            view = get_callable(path)
+        self.views[path] = view
+        return view
+
+    def get_template(self, name):
+        if settings.DEBUG:
+            # keep picking up template changes during development
+            return loader.get_template(name)
+        try:
+            return self.templates[name]
+        except KeyError:
+            self.templates[name] = loader.get_template(name)
+            return self.templates[name]
+
+    def preload_once(self):
+        """ preload() on the first page dispatched, not in AppConfig.ready() which must not query """
+        if not self.preloaded:
+            self.preload()
+
+    def preload(self):
+        """ Resolve the views and templates of all Navigation pages, returning (field, value, exception) for each failure """
+        from simple_cms.models import Navigation
+        errors = []
+        for view, template in Navigation.objects.values_list('view', 'template').distinct():
+            if view:
+                try:
+                    self.get_view(view)
+                except Exception as e:
+                    errors.append(('view', view, e))
+            if template:
+                try:
+                    self.get_template(template)
+                except Exception as e:
+                    errors.append(('template', template, e))
+        self.preloaded = True
+        return errors
+
+registry = Registry()
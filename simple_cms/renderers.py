@@ -0,0 +1,63 @@
+"""
+Renderers turning text into html for each FORMAT_CHOICES format.
+
+Register extra or replacement renderers with the register decorator, or with
+SIMPLE_CMS_RENDERERS, a dict of format to the dotted path of a function taking the text.
+Bump a renderer's version when its output changes, then run "manage.py rerender_text".
+"""
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+renderers = {}
+
+def register(format, version=1):
+    def decorator(func):
+        renderers[format] = (func, '%s:%s' % (format, version))
+        return func
+    return decorator
+
+_settings_loaded = []
+
+def get_renderer(format):
+    """ (function, version) for format, or None """
+    if not _settings_loaded:
+        for name, path in getattr(settings, 'SIMPLE_CMS_RENDERERS', {}).items():
+            func = import_string(path)
+            register(name, getattr(func, 'version', 1))(func)
+        _settings_loaded.append(True)
+    return renderers.get(format or 'html')
+
+def get_version(format):
+    renderer = get_renderer(format)
+    if renderer:
+        return renderer[1]
+    return ''
+
+def render(format, text):
+    """ (html, renderer version), ('', '') when there is no renderer or its library is not installed """
+    renderer = get_renderer(format)
+    if not renderer:
+        return '', ''
+    try:
+        return renderer[0](text), renderer[1]
+    except ImportError:
+        return '', ''
+
+@register('html')
+def render_html(text):
+    return text
+
+@register('markdown')
+def render_markdown(text):
+    import markdown
+    return markdown.markdown(text)
+
+@register('textile')
+def render_textile(text):
+    import textile
+    return textile.textile(text)
+
+@register('restructuredtext')
+def render_restructuredtext(text):
+    from docutils.core import publish_parts
+    return publish_parts(source=text, writer_name='html4css1', settings_overrides={'report_level': 5})['fragment']
@@ -0,0 +1,298 @@
+"""
+Full-text search of articles.
+
+SIMPLE_CMS_SEARCH_BACKEND is the dotted path of a backend class. Without it the
+backend follows the database: PostgresBackend (a tsvector table with a GIN index)
+on PostgreSQL, SqliteBackend (an FTS5 table) on SQLite when FTS5 is available,
+and DatabaseBackend, the old unranked icontains search, anywhere else.
+PythonBackend keeps an in-process inverted index, eg. for tests.
+
+The index tables are created by migration 0007 and kept current by the signal
+handlers in simple_cms.signals. Run "manage.py rebuild_search_index" after
+loading articles with queryset.update() or raw SQL.
+"""
+import math
+import re
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils.html import escape, strip_tags
+from django.utils.module_loading import import_string
+from django.utils.safestring import mark_safe
+
+WORD_RE = re.compile(r'\w+', re.UNICODE)
+
+def get_terms(text):
+    return [term for term in WORD_RE.findall(text.lower()) if len(term) > 1]
+
+def build_document(title, tag_names, excerpt, html, text):
+    """ (title, tags, body) text indexed for an article """
+    return title, ' '.join(tag_names), '%s %s' % (strip_tags(excerpt), strip_tags(html or text))
+
+def get_document(article):
+    return build_document(article.title, [tag.name for tag in article.tags.all()], article.excerpt, article.html, article.text)
+
+def highlight(text, query, length=200):
+    """ Escaped excerpt of text around the first query term, with every term wrapped in <mark> """
+    text = strip_tags(text)
+    terms = get_terms(query)
+    if not terms:
+        return escape(text[:length])
+    term_re = re.compile(r'\b(%s)\w*' % '|'.join([re.escape(term) for term in terms]), re.IGNORECASE | re.UNICODE)
+    match = term_re.search(text)
+    start = max(0, match.start() - length // 4) if match else 0
+    excerpt = text[start:start + length]
+    parts = []
+    position = 0
+    for match in term_re.finditer(excerpt):
+        parts.append(escape(excerpt[position:match.start()]))
+        parts.append('<mark>%s</mark>' % escape(match.group(0)))
+        position = match.end()
+    parts.append(escape(excerpt[position:]))
+    snippet = ''.join(parts)
+    if start:
+        snippet = '&hellip;' + snippet
+    if start + length < len(text):
+        snippet += '&hellip;'
+    return mark_safe(snippet)
+
+class SearchBackend(object):
+    limit = 1000
+
+    def __init__(self):
+        self.limit = getattr(settings, 'SIMPLE_CMS_SEARCH_LIMIT', self.limit)
+
+    def search(self, query):
+        """ [(article id, rank)] best first """
+        raise NotImplementedError
+
+    @transaction.atomic
+    def update(self, article):
+        """ Index article, or drop it from the index if it is not active """
+        self.remove(article.pk)
+        if article.active:
+            self.index(article.pk, *get_document(article))
+
+    def index(self, pk, title, tags, body):
+        raise NotImplementedError
+
+    def remove(self, pk):
+        raise NotImplementedError
+
+    def clear(self):
+        raise NotImplementedError
+
+    @transaction.atomic
+    def rebuild(self):
+        from simple_cms.models import Article
+        self.clear()
+        count = 0
+        for article in Article.objects.get_active().prefetch_related('tags'):
+            self.index(article.pk, *get_document(article))
+            count += 1
+        return count
+
+class DatabaseBackend(SearchBackend):
+    """ icontains over title, text and excerpt or an exact tag name, newest first, no index """
+
+    def search(self, query):
+        from simple_cms.models import Article
+        articles = Article.objects.get_active().filter(
+            Q(title__icontains=query) |
+            Q(text__icontains=query) |
+            Q(excerpt__icontains=query) |
+            Q(tags__name__in=[query])).distinct()
+        return [(pk, 0) for pk in articles.values_list('pk', flat=True)[:self.limit]]
+
+    def update(self, article):
+        pass
+
+    def remove(self, pk):
+        pass
+
+    def rebuild(self):
+        return 0
+
+class PostgresBackend(SearchBackend):
+    """ Weighted tsvector of title (A), tags (B) and body (C) per article, ranked with ts_rank_cd """
+    table = 'simple_cms_articlesearch'
+
+    def __init__(self):
+        super(PostgresBackend, self).__init__()
+        self.config = getattr(settings, 'SIMPLE_CMS_SEARCH_CONFIG', 'english')
+
+    def search(self, query):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT article_id, ts_rank_cd(document, query) AS rank '
+                'FROM ' + self.table + ', plainto_tsquery(%s::regconfig, %s) query '
+                'WHERE document @@ query ORDER BY rank DESC, article_id DESC LIMIT %s',
+                [self.config, query, self.limit])
+            return list(cursor.fetchall())
+
+    def index(self, pk, title, tags, body):
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'INSERT INTO ' + self.table + ' (article_id, document) VALUES (%s, '
+                'setweight(to_tsvector(%s::regconfig, %s), \'A\') || '
+                'setweight(to_tsvector(%s::regconfig, %s), \'B\') || '
+                'setweight(to_tsvector(%s::regconfig, %s), \'C\'))',
+                [pk, self.config, title, self.config, tags, self.config, body])
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM ' + self.table + ' WHERE article_id = %s', [pk])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM ' + self.table)
+
+class SqliteBackend(SearchBackend):
+    """ FTS5 table of title, tags and body keyed by article id, ranked with bm25 """
+    table = 'simple_cms_articlefts'
+    weights = (10.0, 5.0, 1.0)
+
+    def search(self, query):
+        # quoted terms, so FTS5 query syntax in the input is matched literally
+        match = ' '.join(['"%s"' % term.replace('"', '""') for term in get_terms(query)])
+        if not match:
+            return []
+        rank = 'bm25(%s, %s, %s, %s)' % ((self.table,) + self.weights)
+        with connection.cursor() as cursor:
+            cursor.execute(
+                'SELECT rowid, -' + rank + ' FROM ' + self.table + ' WHERE ' + self.table + ' MATCH %s '
+                'ORDER BY ' + rank + ', rowid DESC LIMIT %s',
+                [match, self.limit])
+            return list(cursor.fetchall())
+
+    def index(self, pk, title, tags, body):
+        with connection.cursor() as cursor:
+            cursor.execute('INSERT INTO ' + self.table + ' (rowid, title, tags, body) VALUES (%s, %s, %s, %s)', [pk, title, tags, body])
+
+    def remove(self, pk):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM ' + self.table + ' WHERE rowid = %s', [pk])
+
+    def clear(self):
+        with connection.cursor() as cursor:
+            cursor.execute('DELETE FROM ' + self.table)
+
+class PythonBackend(SearchBackend):
+    """
+    In-process inverted index ranked by tf-idf, title and tag terms counting extra.
+    Loaded on first search and only updated by saves in this process.
+    """
+    weights = (3, 2, 1)
+
+    def __init__(self):
+        super(PythonBackend, self).__init__()
+        self.postings = None
+
+    def update(self, article):
+        # nothing to keep current before the first search loads the index
+        if self.postings is not None:
+            super(PythonBackend, self).update(article)
+
+    def index(self, pk, title, tags, body):
+        frequencies = {}
+        for weight, text in zip(self.weights, (title, tags, body)):
+            for term in get_terms(text):
+                frequencies[term] = frequencies.get(term, 0) + weight
+        for term, frequency in frequencies.items():
+            self.postings.setdefault(term, {})[pk] = frequency
+        self.documents[pk] = list(frequencies)
+
+    def remove(self, pk):
+        if self.postings is None:
+            return
+        for term in self.documents.pop(pk, []):
+            self.postings[term].pop(pk, None)
+            if not self.postings[term]:
+                del self.postings[term]
+
+    def clear(self):
+        self.postings = {}
+        self.documents = {}
+
+    def search(self, query):
+        if self.postings is None:
+            self.rebuild()
+        terms = set(get_terms(query))
+        if not terms:
+            return []
+        postings = [self.postings.get(term, {}) for term in terms]
+        # every term has to match, like plainto_tsquery and FTS5
+        pks = set.intersection(*[set(posting) for posting in postings])
+        total = len(self.documents)
+        ranks = {}
+        for posting in postings:
+            idf = math.log(1 + float(total) / len(posting)) if posting else 0
+            for pk in pks:
+                ranks[pk] = ranks.get(pk, 0) + posting[pk] * idf
+        return sorted(ranks.items(), key=lambda item: (-item[1], -item[0]))[:self.limit]
+
+class SearchResults(object):
+    """
+    Ranked search hits, usable as a ListView queryset.
+    Articles are loaded a slice at a time, so paginating only fetches the page shown.
+    Each carries search_rank and a highlighted search_snippet.
+    """
+
+    def __init__(self, query, hits):
+        from simple_cms.models import Article
+        self.model = Article
+        self.query = query
+        self.ranks = dict(hits)
+        self.pks = [pk for pk, rank in hits]
+
+    def __len__(self):
+        return len(self.pks)
+
+    def count(self):
+        return len(self.pks)
+
+    def fetch(self, pks):
+        articles = self.model.objects.in_bulk(pks)
+        objects = []
+        for pk in pks:
+            article = articles.get(pk)
+            if article is None:
+                continue
+            article.search_rank = self.ranks[pk]
+            article.search_snippet = highlight(article.excerpt or article.html or article.text, self.query)
+            objects.append(article)
+        return objects
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.fetch(self.pks[key])
+        return self.fetch([self.pks[key]])[0]
+
+    def __iter__(self):
+        return iter(self.fetch(self.pks))
+
+_backend = []
+
+def get_backend_class():
+    path = getattr(settings, 'SIMPLE_CMS_SEARCH_BACKEND', None)
+    if path:
+        return import_string(path)
+    if connection.vendor == 'postgresql':
+        return PostgresBackend
+    if connection.vendor == 'sqlite' and SqliteBackend.table in connection.introspection.table_names():
+        return SqliteBackend
+    return DatabaseBackend
+
+def get_backend():
+    if not _backend:
+        _backend.append(get_backend_class()())
+    return _backend[0]
+
+def search_articles(query):
+    """ SearchResults of the active articles matching query """
+    from simple_cms.models import Article
+    hits = get_backend().search(query)
+    # the index may trail a queryset.update(), never list inactive articles
+    active = set(Article.objects.get_active().filter(pk__in=[pk for pk, rank in hits]).values_list('pk', flat=True))
+    return SearchResults(query, [(pk, rank) for pk, rank in hits if pk in active])
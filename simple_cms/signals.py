@@ -0,0 +1,90 @@
+from django.contrib.sites.models import Site
+from django.db import transaction
+from django.contrib.contenttypes.models import ContentType
+from django.db.models.signals import m2m_changed, post_save, post_delete, pre_delete, pre_save
+from django.core.signals import request_finished, request_started
+from django.dispatch import Signal
+
+from simple_cms.cache import finish_request, invalidate_model, page_url_map, start_request
+from simple_cms.models import ArchiveCount, Article, Block, BlockGroup, Category, Navigation, NavigationGroup, RelatedBlock, Seo
+from simple_cms.search import get_backend
+
+# sent when time passes a scheduled publish_start or publish_end, eg. to refresh feeds or sitemaps
+publish_transition = Signal(providing_args=['boundary', 'window'])
+
+def model_changed(sender, **kwargs):
+    # wait for the commit, otherwise another process could cache the old rows under the new version
+    transaction.on_commit(lambda: invalidate_model(sender))
+
+def navigation_saved(sender, instance, **kwargs):
+    # bumps the navigation version too, patching the page url map on the way
+    transaction.on_commit(lambda: page_url_map.page_saved(instance.pk))
+
+def article_pre_save(sender, instance, **kwargs):
+    # a changed post_date moves the article out of its old year
+    instance._archive_year = None
+    if instance.pk:
+        old = Article.objects.filter(pk=instance.pk).values_list('post_date', flat=True).first()
+        if old:
+            instance._archive_year = ('year', ArchiveCount.objects.get_year(old))
+
+def article_saved(sender, instance, **kwargs):
+    keys = ArchiveCount.objects.article_keys(instance)
+    if getattr(instance, '_archive_year', None):
+        keys.append(instance._archive_year)
+    ArchiveCount.objects.recount(keys)
+    transaction.on_commit(lambda: get_backend().update(instance))
+
+def article_pre_delete(sender, instance, **kwargs):
+    instance._archive_keys = ArchiveCount.objects.article_keys(instance)
+
+def article_deleted(sender, instance, **kwargs):
+    ArchiveCount.objects.recount(getattr(instance, '_archive_keys', []))
+    pk = instance.pk
+    transaction.on_commit(lambda: get_backend().remove(pk))
+
+def article_categories_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    if action == 'pre_clear':
+        if reverse:
+            instance._archive_keys = [('category', '%s' % instance.pk)]
+        else:
+            instance._archive_keys = [('category', '%s' % pk) for pk in instance.categories.values_list('pk', flat=True)]
+    elif action == 'post_clear':
+        ArchiveCount.objects.recount(getattr(instance, '_archive_keys', []))
+        model_changed(Article)
+    elif action in ('post_add', 'post_remove'):
+        if reverse:
+            ArchiveCount.objects.recount([('category', '%s' % instance.pk)])
+        else:
+            ArchiveCount.objects.recount([('category', '%s' % pk) for pk in pk_set])
+        model_changed(Article)
+
+def category_deleted(sender, instance, **kwargs):
+    # the article links go with the category without sending m2m_changed
+    ArchiveCount.objects.filter(kind='category', key='%s' % instance.pk).delete()
+
+def article_tagged(sender, instance, **kwargs):
+    if instance.content_type_id == ContentType.objects.get_for_model(Article).pk:
+        ArchiveCount.objects.recount([('tag', instance.tag.slug)])
+        model_changed(Article)
+        article = Article.objects.filter(pk=instance.object_id).first()
+        if article:
+            transaction.on_commit(lambda: get_backend().update(article))
+
+def connect_signals():
+    request_started.connect(start_request, dispatch_uid='simple_cms_request_started')
+    request_finished.connect(finish_request, dispatch_uid='simple_cms_request_finished')
+    for model in (NavigationGroup, Site, Block, BlockGroup, RelatedBlock, Seo, Article, Category):
+        post_save.connect(model_changed, sender=model, dispatch_uid='simple_cms_%s_saved' % model._meta.model_name)
+    for model in (Navigation, NavigationGroup, Site, Block, BlockGroup, RelatedBlock, Seo, Article, Category):
+        post_delete.connect(model_changed, sender=model, dispatch_uid='simple_cms_%s_deleted' % model._meta.model_name)
+    post_save.connect(navigation_saved, sender=Navigation, dispatch_uid='simple_cms_navigation_saved')
+    pre_save.connect(article_pre_save, sender=Article, dispatch_uid='simple_cms_article_pre_save')
+    post_save.connect(article_saved, sender=Article, dispatch_uid='simple_cms_article_archive_saved')
+    pre_delete.connect(article_pre_delete, sender=Article, dispatch_uid='simple_cms_article_pre_delete')
+    post_delete.connect(article_deleted, sender=Article, dispatch_uid='simple_cms_article_archive_deleted')
+    m2m_changed.connect(article_categories_changed, sender=Article.categories.through, dispatch_uid='simple_cms_article_categories_changed')
+    post_delete.connect(category_deleted, sender=Category, dispatch_uid='simple_cms_category_archive_deleted')
+    tagged_item = Article.tags.through
+    post_save.connect(article_tagged, sender=tagged_item, dispatch_uid='simple_cms_article_tagged')
+    post_delete.connect(article_tagged, sender=tagged_item, dispatch_uid='simple_cms_article_untagged')
@@ -1,26 +1,35 @@
+import datetime
+
 from django import template
 from django.template import Node
 from django.contrib.sites.models import Site
+from django.contrib.sites.requests import RequestSite
 from django.contrib.contenttypes.models import ContentType
 from django.conf import settings
+from django.utils import timezone, translation
 
-from simple_cms.models import Navigation, Block, Article, Category
+from simple_cms.cache import FRAGMENT_DEPENDENCIES, get_compiled_template, get_fragment, get_fragment_key, get_navigation_tree, get_page_url, get_site_for_host, navigation_cache_enabled, resolve_page_links
+from simple_cms.models import Navigation, Block, RelatedBlock, Article, ArchiveCount, Category
 from simple_cms.forms import ArticleSearchForm
+from simple_cms.instrumentation import instrument_library
 
 register = template.Library()
 
 @register.simple_tag(takes_context=True)
 def page_url(context, id):
-    try:
-        nav = Navigation.objects.get(pk=id)
-        if nav.url:
-            return nav.url
-        protocol = 'http://'
-        if context['request'].is_secure():
-            protocol = 'https://'
-        return '%s%s%s' % (protocol, nav.site.domain, nav.get_absolute_url())
-    except Navigation.DoesNotExist:
-        return ''
+    protocol = 'http://'
+    request = context.get('request')
+    if request is not None and request.is_secure():
+        protocol = 'https://'
+    return get_page_url(id, protocol)
+
+@register.filter(is_safe=True)
+def page_links(value, request=None):
+    """ Rewrite [[page:<id>]] placeholders in rendered text to page urls, eg. {{ page.get_html|page_links:request }} """
+    protocol = 'http://'
+    if request is not None and request.is_secure():
+        protocol = 'https://'
+    return resolve_page_links(value, protocol)
 
 @register.assignment_tag
 def get_nav_by_group(group_name):
@@ -31,21 +40,100 @@ def get_nav_by_group(group_name):
             kwargs['site'] = Site.objects.get_current()
     except:
         pass
+    if navigation_cache_enabled():
+        # ordered list from the per site navigation snapshot, urls come from the stored paths
+        site = kwargs.get('site')
+        return get_navigation_tree(site.pk if site else None).get_group(group_name)
     return Navigation.objects.get_active().filter(**kwargs).order_by('order')
 
-@register.assignment_tag
-def get_block(key):
-    try:
-        return Block.objects.get(key=key)
-    except:
-        return
+class BlockNode(template.Node):
+
+    def __init__(self, key, var_name, template_keys):
+        self.key = key
+        self.var_name = var_name
+        self.template_keys = template_keys
+
+    def render(self, context):
+        key = self.key.resolve(context)
+        # the first get_block rendered fetches every literal key of its template
+        blocks = context.render_context.get(id(self.template_keys))
+        if blocks is None:
+            blocks = Block.objects.get_cached_many(self.template_keys)
+            context.render_context[id(self.template_keys)] = blocks
+        if key in blocks:
+            context[self.var_name] = blocks[key]
+        else:
+            context[self.var_name] = Block.objects.get_cached(key)
+        return ''
+
+@register.tag
+def get_block(parser, token):
+    """
+    Tag should be called like so:
+        {% get_block <key> as <variable> %}
+    Sets variable to the active Block with that key, or None.
+    """
+    bits = token.split_contents()
+    if len(bits) != 4 or bits[2] != 'as':
+        raise template.TemplateSyntaxError("get_block key as varname")
+    key = parser.compile_filter(bits[1])
+    # literal keys are shared by all get_block nodes of the template being parsed
+    if not hasattr(parser, 'simple_cms_block_keys'):
+        parser.simple_cms_block_keys = []
+    if not isinstance(key.var, template.Variable) and not key.filters:
+        parser.simple_cms_block_keys.append(key.var)
+    return BlockNode(key, bits[3], parser.simple_cms_block_keys)
 
 @register.filter
 def render_as_template(value, request):
-    t = template.Template(value)
+    t = get_compiled_template(value)
     c = template.Context(template.RequestContext(request))
     return t.render(c)
 
+class CmsCacheNode(template.Node):
+
+    def __init__(self, nodelist, name, vary_on, dependencies):
+        self.nodelist = nodelist
+        self.name = name
+        self.vary_on = vary_on
+        self.dependencies = dependencies
+
+    def get_site_id(self, context):
+        request = context.get('request')
+        if request is not None:
+            site = get_site_for_host(RequestSite(request).domain)
+            if site:
+                return site.pk
+        return getattr(settings, 'SITE_ID', None)
+
+    def render(self, context):
+        vary_on = [self.get_site_id(context), translation.get_language()]
+        vary_on.extend([var.resolve(context) for var in self.vary_on])
+        key = get_fragment_key(self.name, self.dependencies, vary_on)
+        return get_fragment(key, lambda: self.nodelist.render(context))
+
+@register.tag
+def cms_cache(parser, token):
+    """
+    Tag should be called like so:
+        {% cms_cache <fragment name> [<vary on> ...] [using "<model> <model> ..."] %} ... {% endcms_cache %}
+    The fragment is cached until any model simple_cms reads from is saved (see FRAGMENT_DEPENDENCIES),
+    or only the models listed after using. It always varies on the site and language.
+    """
+    bits = token.split_contents()
+    if len(bits) < 2:
+        raise template.TemplateSyntaxError("cms_cache name [vary_on ...] [using \"models\"]")
+    dependencies = FRAGMENT_DEPENDENCIES
+    if len(bits) > 3 and bits[-2] == 'using':
+        dependencies = tuple(bits[-1].strip('"\'').lower().split())
+        unknown = [name for name in dependencies if name not in FRAGMENT_DEPENDENCIES]
+        if unknown:
+            raise template.TemplateSyntaxError("cms_cache can't depend on %s, use some of: %s" % (', '.join(unknown), ' '.join(FRAGMENT_DEPENDENCIES)))
+        bits = bits[:-2]
+    nodelist = parser.parse(('endcms_cache',))
+    parser.delete_first_token()
+    return CmsCacheNode(nodelist, bits[1], [parser.compile_filter(bit) for bit in bits[2:]], dependencies)
+
 class NavigationBlocksNode(template.Node):
     
     def __init__(self, instance, var_name, group_name=''):
@@ -58,34 +146,11 @@ class NavigationBlocksNode(template.Node):
     def render(self, context):
         blocks = None
         instance = self.instance.resolve(context)
-        # spin this off into a separate template tag perhaps
-        # we could just filter it all out afterwards, but heck, do 2 optimized queries
-        # dynamic args, yo, easy peazy
-        # navigation_type = ContentType.objects.get_for_model(Navigation)
-        
         try:
+            group = None
             if self.group_name:
                 group = self.group_name.resolve(context)
-                blocks = [block.block for block in instance.blocks.filter(active=True, group__title=group)]
-                if hasattr(instance, 'parent') and hasattr(instance, 'inherit_blocks'):
-                    if instance.inherit_blocks:
-                        while instance.parent:
-                            instance = instance.parent
-                            for block in instance.blocks.filter(active=True, group__title=group):
-                                blocks.append(block.block)
-                            if not instance.inherit_blocks:
-                                break
-            
-            else:
-                blocks = [block.block for block in instance.blocks.filter(active=True)]
-                if hasattr(instance, 'parent') and hasattr(instance, 'inherit_blocks'):
-                    if instance.inherit_blocks:
-                        while instance.parent:
-                            instance = instance.parent
-                            for block in instance.blocks.filter(active=True):
-                                blocks.append(block.block)
-                            if not instance.inherit_blocks:
-                                break
+            blocks = RelatedBlock.objects.get_blocks(instance, group)
         except:
             pass
         context[self.var_name] = blocks
@@ -129,10 +194,11 @@ def get_article_search_form(parser, token):
     bits = arg.split()
     return ArticleSearchFormNode(bits[1])
 
-def get_articles(articles, length):
-    count = len(articles)
-    if length:
+def get_articles(articles, length, count=None):
+    # count comes from ArchiveCount when the caller has it, saving a COUNT query
+    if count is None:
         count = articles.count()
+    if length:
         articles = articles[:length]
     return {
         'count': count,
@@ -142,17 +208,24 @@ def get_articles(articles, length):
 @register.assignment_tag
 def get_articles_for_tag(tag, length=None):
     articles = Article.objects.get_active().filter(tags__slug__in=[tag])
-    return get_articles(articles, length)
+    return get_articles(articles, length, ArchiveCount.objects.get_count('tag', tag))
 
 @register.assignment_tag
 def get_articles_for_category(category, length=None):
-    articles = Article.objects.get_active().filter(category__slug__in=[category])
-    return get_articles(articles, length)
+    articles = Article.objects.get_active().filter(categories__slug__in=[category]).distinct()
+    pks = Category.objects.filter(slug=category).values_list('pk', flat=True)
+    return get_articles(articles, length, ArchiveCount.objects.get_count('category', *pks))
 
 @register.assignment_tag
 def get_article_categories():
-    return Category.objects.get_active().exclude(articles=None)
+    return Category.objects.get_active().filter(pk__in=ArchiveCount.objects.get_keys('category'))
 
 @register.assignment_tag
 def get_article_years():
-    return Article.objects.get_active().datetimes('post_date', 'year').reverse()
+    years = sorted([int(year) for year in ArchiveCount.objects.get_keys('year')], reverse=True)
+    dates = [datetime.datetime(year, 1, 1) for year in years]
+    if settings.USE_TZ:
+        dates = [timezone.make_aware(date, timezone.get_current_timezone()) for date in dates]
+    return dates
+
+instrument_library(register)
@@ -0,0 +1,278 @@
+import datetime
+from unittest import skipUnless
+
+from django.contrib.sites.models import Site
+from django.core.exceptions import ValidationError
+from django.db import connection
+from django.template import Context, RequestContext, Template, TemplateSyntaxError
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+
+from simple_cms.cache import VERSION_KEY_PREFIX, bump_version, finish_request, get_cache, get_navigation_tree, get_shared_versions, start_request
+from simple_cms.context_processors import NavigationHelper, navigation
+from simple_cms.management.commands.check_query_plans import get_explain
+from simple_cms.models import ArchiveCount, Article, Block, BlockGroup, Category, Navigation, RelatedBlock
+from simple_cms.pagination import CursorPaginator
+from simple_cms import search
+
+class NavigationContextQueryTest(TestCase):
+
+    def setUp(self):
+        site = Site.objects.get_current()
+        parent = Navigation.objects.create(title='About', slug='about', site=site)
+        Navigation.objects.create(title='Team', slug='team', site=site, parent=parent)
+
+    def render(self, request):
+        return Template('{{ page.title }}').render(RequestContext(request, {}, [navigation]))
+
+    def test_second_render_in_a_request_runs_no_queries(self):
+        request = RequestFactory().get('/about/team/')
+        with CaptureQueriesContext(connection) as first:
+            self.assertEqual(self.render(request), 'Team')
+        self.assertTrue(len(first))
+        with CaptureQueriesContext(connection) as second:
+            self.assertEqual(self.render(request), 'Team')
+        self.assertEqual(len(second), 0)
+
+class NavigationTreeTest(TestCase):
+
+    def test_page_can_not_move_below_its_descendant(self):
+        site = Site.objects.get_current()
+        parent = Navigation.objects.create(title='About', slug='about', site=site)
+        child = Navigation.objects.create(title='Team', slug='team', site=site, parent=parent)
+        parent.parent = child
+        with self.assertRaises(ValidationError):
+            parent.full_clean()
+
+class RequestVersionsTest(TestCase):
+
+    def tearDown(self):
+        finish_request()
+
+    def test_versions_are_read_once_per_request(self):
+        start_request()
+        before = get_shared_versions('block')
+        # another process saving a block mid-request is picked up by the next request
+        get_cache().set(VERSION_KEY_PREFIX + 'block', 'elsewhere', None)
+        self.assertEqual(get_shared_versions('block'), before)
+        finish_request()
+        self.assertEqual(get_shared_versions('block'), ('elsewhere',))
+
+    def test_bump_in_request_is_seen_at_once(self):
+        start_request()
+        before = get_shared_versions('block')
+        bump_version('block')
+        self.assertNotEqual(get_shared_versions('block'), before)
+
+class CmsCacheTest(TransactionTestCase):
+    # the versions are bumped on commit, which TestCase never does
+
+    def test_fragment_around_get_blocks_follows_new_related_blocks(self):
+        site, created = Site.objects.get_or_create(pk=1, defaults={'domain': 'example.com', 'name': 'example.com'})
+        page = Navigation.objects.create(title='About', slug='about', site=site)
+        first = Block.objects.create(key='first')
+        second = Block.objects.create(key='second')
+        RelatedBlock.objects.create(content_object=page, block=first)
+        template = Template('{% load simple_cms_tags %}{% cms_cache blocks %}{% get_blocks for page as blocks %}'
+            '{% for block in blocks %}{{ block.key }},{% endfor %}{% endcms_cache %}')
+        self.assertEqual(template.render(Context({'page': page})), 'first,')
+        RelatedBlock.objects.create(content_object=page, block=second)
+        self.assertEqual(template.render(Context({'page': page})), 'first,second,')
+
+    def test_unknown_dependency_is_a_syntax_error(self):
+        with self.assertRaises(TemplateSyntaxError):
+            Template('{% load simple_cms_tags %}{% cms_cache menu using "navigaton" %}{% endcms_cache %}')
+
+@override_settings(SIMPLE_CMS_SEARCH_BACKEND='simple_cms.search.PythonBackend')
+class PythonSearchBackendTest(TestCase):
+
+    def setUp(self):
+        search._backend[:] = []
+        self.caching = Article.objects.create(title='Django caching', text='Fast pages')
+        self.other = Article.objects.create(title='Other', text='Mentions django once')
+        self.hidden = Article.objects.create(title='Django hidden', active=False)
+
+    def tearDown(self):
+        search._backend[:] = []
+
+    def search(self, backend, query):
+        return [pk for pk, rank in backend.search(query)]
+
+    def test_title_matches_rank_above_body_matches(self):
+        self.assertEqual(self.search(search.PythonBackend(), 'django'), [self.caching.pk, self.other.pk])
+
+    def test_every_term_has_to_match(self):
+        self.assertEqual(self.search(search.PythonBackend(), 'django pages'), [self.caching.pk])
+
+    def test_update_and_remove(self):
+        backend = search.PythonBackend()
+        self.search(backend, 'django')
+        backend.remove(self.other.pk)
+        self.assertEqual(self.search(backend, 'django'), [self.caching.pk])
+        self.hidden.active = True
+        backend.update(self.hidden)
+        self.assertEqual(set(self.search(backend, 'hidden')), set([self.hidden.pk]))
+        self.caching.active = False
+        backend.update(self.caching)
+        self.assertEqual(self.search(backend, 'caching'), [])
+
+    def test_search_articles_skips_articles_deactivated_behind_the_index(self):
+        self.assertEqual(search.search_articles('django').pks, [self.caching.pk, self.other.pk])
+        Article.objects.filter(pk=self.caching.pk).update(active=False)
+        results = search.search_articles('django')
+        self.assertEqual(results.pks, [self.other.pk])
+        self.assertEqual([article.pk for article in results[0:1]], [self.other.pk])
+
+class ArchiveCountTest(TestCase):
+
+    def setUp(self):
+        self.category = Category.objects.create(title='News')
+        self.article = Article.objects.create(title='First')
+        self.article.categories.add(self.category)
+        self.article.tags.add('django')
+        self.year = ArchiveCount.objects.get_year(self.article.post_date)
+
+    def counts(self):
+        return (
+            ArchiveCount.objects.get_count('year', self.year),
+            ArchiveCount.objects.get_count('category', self.category.pk),
+            ArchiveCount.objects.get_count('tag', 'django'),
+        )
+
+    def test_counts_follow_the_article(self):
+        self.assertEqual(self.counts(), (1, 1, 1))
+        self.article.active = False
+        self.article.save()
+        self.assertEqual(self.counts(), (0, 0, 0))
+        self.article.active = True
+        self.article.save()
+        self.article.categories.remove(self.category)
+        self.article.tags.remove('django')
+        self.assertEqual(self.counts(), (1, 0, 0))
+        self.article.delete()
+        self.assertEqual(self.counts(), (0, 0, 0))
+
+    def test_deleted_category_leaves_no_counter(self):
+        self.category.delete()
+        self.assertFalse(ArchiveCount.objects.filter(kind='category').exists())
+
+    def test_rebuild_matches_the_signal_counts(self):
+        Article.objects.create(title='Second').categories.add(self.category)
+        counts = list(ArchiveCount.objects.filter(count__gt=0).values_list('kind', 'key', 'count'))
+        ArchiveCount.objects.rebuild()
+        self.assertEqual(list(ArchiveCount.objects.values_list('kind', 'key', 'count')), counts)
+        self.assertEqual(ArchiveCount.objects.count(), len(counts))
+
+class PublishedIdsTest(TestCase):
+
+    def setUp(self):
+        get_cache().clear()
+        self.articles = [Article.objects.create(title='Article %s' % i) for i in range(3)]
+        Article.objects.filter(pk__in=[article.pk for article in self.articles]).update(post_date=self.articles[0].post_date)
+        self.articles = list(Article.objects.order_by('pk'))
+        later = Article.objects.create(title='Later')
+        Article.objects.filter(pk=later.pk).update(publish_start=timezone.now() + datetime.timedelta(days=1))
+
+    def test_ids_are_cached_for_the_window(self):
+        ids = Article.objects.get_published_ids()
+        self.assertEqual(ids, [article.pk for article in reversed(self.articles)])
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(Article.objects.get_published_ids(), ids)
+        self.assertEqual(len(queries), 0)
+
+    def test_adjacent_matches_the_keyset_lookups(self):
+        for article in self.articles:
+            self.assertEqual(Article.objects.get_adjacent(article), Article.objects.get_adjacent(article, Article.objects.get_published()))
+        self.assertEqual(Article.objects.get_adjacent(self.articles[1]), (self.articles[0], self.articles[2]))
+
+class ReorderTest(TestCase):
+
+    def setUp(self):
+        self.site = Site.objects.get_current()
+        self.pages = [Navigation.objects.create(title=title, slug=title, site=self.site) for title in ('a', 'b', 'c')]
+
+    def test_reorder_writes_the_given_order(self):
+        ids = [self.pages[2].pk, self.pages[0].pk, self.pages[1].pk]
+        Navigation.objects.reorder(ids, parent=None, site=self.site)
+        self.assertEqual(list(Navigation.objects.filter(parent=None, site=self.site).order_by('order').values_list('pk', flat=True)), ids)
+
+    def test_reorder_needs_the_whole_collection(self):
+        with self.assertRaises(ValueError):
+            Navigation.objects.reorder([self.pages[0].pk], parent=None, site=self.site)
+        with self.assertRaises(ValueError):
+            Navigation.objects.reorder([page.pk for page in self.pages], parent=None)
+
+class CursorPaginatorTest(TestCase):
+
+    def setUp(self):
+        ends = [None, timezone.now(), None, timezone.now() + datetime.timedelta(days=1), None]
+        for i, end in enumerate(ends):
+            Article.objects.create(title='Article %s' % i, publish_end=end)
+
+    def walk(self, ordering):
+        paginator = CursorPaginator(Article.objects.all(), 2, ordering)
+        page = paginator.page()
+        pages = [[article.pk for article in page]]
+        while page.has_next():
+            page = paginator.page(page.next_cursor)
+            pages.append([article.pk for article in page])
+        backwards = [pages[-1]]
+        while page.has_previous():
+            page = paginator.page(page.previous_cursor)
+            backwards.insert(0, [article.pk for article in page])
+        return pages, backwards
+
+    def test_cursors_walk_past_null_sort_values(self):
+        for ordering in (('publish_end', 'pk'), ('-publish_end', '-pk')):
+            expected = list(Article.objects.order_by(*ordering).values_list('pk', flat=True))
+            pages, backwards = self.walk(ordering)
+            self.assertEqual(sum(pages, []), expected)
+            self.assertEqual(backwards, pages)
+
+@skipUnless(connection.vendor in ('sqlite', 'postgresql'), 'query plans are only checked on SQLite and PostgreSQL')
+class QueryPlanTest(TestCase):
+    """ EXPLAIN every statement the hot code paths run, none may read a whole table """
+
+    def setUp(self):
+        self.site = Site.objects.get_current()
+        parent = Navigation.objects.create(title='About', slug='about', site=self.site)
+        self.page = Navigation.objects.create(title='Team', slug='team', site=self.site, parent=parent)
+        group = BlockGroup.objects.create(title='sidebar')
+        for key in ('first', 'second'):
+            RelatedBlock.objects.create(content_object=parent, block=Block.objects.create(key=key), group=group)
+        category = Category.objects.create(title='News')
+        for i in range(3):
+            self.article = Article.objects.create(title='Article %s' % i)
+            self.article.categories.add(category)
+            self.article.tags.add('django')
+
+    def run_hot_paths(self):
+        for path_lookup in (True, False):
+            with override_settings(SIMPLE_CMS_NAVIGATION_CACHE=False, SIMPLE_CMS_PATH_LOOKUP=path_lookup):
+                NavigationHelper(RequestFactory().get('/about/team/')).find_page()
+        # start from cold process caches
+        bump_version('navigation')
+        bump_version('relatedblock')
+        get_navigation_tree(self.site.pk)
+        RelatedBlock.objects.get_blocks(self.page, 'sidebar')
+        list(Article.objects.get_published()[:10])
+        Article.objects.get_adjacent(self.article)
+        Template('{% load simple_cms_tags %}{% get_article_years as years %}{% get_article_categories as categories %}'
+            '{% get_articles_for_tag "django" 2 as tagged %}{% get_articles_for_category "news" 2 as filed %}'
+            '{{ years|length }}{% for category in categories %}{{ category.pk }}{% endfor %}'
+            '{% for article in tagged.objects %}{{ article.pk }}{% endfor %}'
+            '{% for article in filed.objects %}{{ article.pk }}{% endfor %}').render(Context())
+
+    def test_hot_queries_use_indexes(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.run_hot_paths()
+        explain = get_explain()
+        statements = [query['sql'] for query in queries.captured_queries if query['sql'].startswith('SELECT')]
+        self.assertTrue(statements)
+        scans = []
+        for sql in statements:
+            lines, table_scans = explain(sql)
+            if table_scans:
+                scans.append((sql, table_scans))
+        self.assertEqual(scans, [])
@@ -1,21 +1,37 @@
+import calendar
+import hashlib
+
 from django.shortcuts import get_object_or_404, render_to_response, render
-from django.template import RequestContext, loader
-from django.template.engine import Engine
+from django.template import RequestContext
+from django.contrib.contenttypes.models import ContentType
 from django.contrib.sites.models import Site
+from django.contrib.sites.requests import RequestSite
 from django.conf import settings
 from django.views.generic import View, ListView, DateDetailView
 from django.views.generic.base import ContextMixin
-from django.db.models import Q
-from django.http import HttpResponse, HttpResponseRedirect, HttpResponsePermanentRedirect, HttpResponseNotFound, Http404
-from django.core.urlresolvers import get_callable
-from django.utils.module_loading import import_string
+from django.db.models import Max
+from django.http import HttpResponse, HttpResponseRedirect, HttpResponsePermanentRedirect, HttpResponseNotFound, HttpResponseNotModified, Http404
+from django.utils.cache import patch_vary_headers
+from django.utils.http import http_date, parse_http_date_safe
 
-from simple_cms.models import Navigation, Article, Category
+from simple_cms.cache import get_cache, get_navigation_tree, get_site_for_host, get_shared_versions, get_stats, navigation_cache_enabled
+from simple_cms.context_processors import navigation
+from simple_cms.models import Navigation, RelatedBlock, Seo, Article, Category
 from simple_cms.forms import ArticleSearchForm
+from simple_cms.pagination import CursorPaginationMixin
+from simple_cms.registry import registry
 
 
 class NavigationView(View):
+    """
+    Renders Navigation pages.
+    Set SIMPLE_CMS_PAGE_CACHE to a timeout in seconds to cache rendered pages per site, path and language.
+    Entries are keyed on the versions of the models a page is built from, so saving any of them retires
+    the cached pages without waiting for the timeout. Like Django's cache middleware, pages of logged in
+    users, pages that used the CSRF token and responses setting cookies are never stored.
+    """
     template_name = settings.SIMPLE_CMS_PAGE_TEMPLATE
+    cache_dependencies = ('navigation', 'navigationgroup', 'site', 'block', 'relatedblock', 'seo')
 
     def post(self, request, *args, **kwargs):
         return self._handler(request, *args, **kwargs)
@@ -23,11 +39,83 @@ class NavigationView(View):
     def get(self, request, *args, **kwargs):
         return self._handler(request, *args, **kwargs)
 
+    def get_cache_key(self, request):
+        timeout = getattr(settings, 'SIMPLE_CMS_PAGE_CACHE', None)
+        if not timeout or request.method not in ('GET', 'HEAD') or request.GET.get('admin_preview'):
+            return None
+        user = getattr(request, 'user', None)
+        if user and user.is_authenticated:
+            return None
+        site_id = getattr(settings, 'SITE_ID', None)
+        if getattr(settings, 'SIMPLE_CMS_CHECK_DOMAIN', False):
+            site = get_site_for_host(RequestSite(request).domain)
+            site_id = site.pk if site else None
+        key = repr((
+            get_shared_versions(*self.cache_dependencies),
+            site_id,
+            request.get_full_path(),
+            getattr(request, 'LANGUAGE_CODE', ''),
+        ))
+        return 'simple_cms:page:%s' % hashlib.md5(key.encode('utf-8')).hexdigest()
+
+    def get_validators(self, request, context):
+        """ ETag and Last-Modified from the page, its ancestors' blocks and the navigation snapshot """
+        pages = context['pageA'] or [context['page']]
+        timestamps = [page.updated_at for page in pages]
+        blocks = RelatedBlock.objects.filter(
+            content_type=ContentType.objects.get_for_model(Navigation),
+            object_id__in=[page.pk for page in pages],
+        ).aggregate(related=Max('updated_at'), block=Max('block__updated_at'))
+        timestamps.extend([value for value in blocks.values() if value])
+        if navigation_cache_enabled() and context['pageA']:
+            timestamps.append(get_navigation_tree(context['page'].site_id).updated_at)
+        last_modified = calendar.timegm(max([t for t in timestamps if t]).utctimetuple())
+        user = getattr(request, 'user', None)
+        key = repr((
+            get_shared_versions(*self.cache_dependencies),
+            context['page'].pk,
+            last_modified,
+            self.template_name,
+            getattr(request, 'LANGUAGE_CODE', ''),
+            bool(user and user.is_authenticated),
+        ))
+        return '"%s"' % hashlib.md5(key.encode('utf-8')).hexdigest(), last_modified
+
+    def is_not_modified(self, request, etag, last_modified):
+        if request.method not in ('GET', 'HEAD'):
+            return False
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match:
+            etags = [value.strip() for value in if_none_match.split(',')]
+            return '*' in etags or etag in etags or 'W/%s' % etag in etags
+        if_modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE', ''))
+        return if_modified_since is not None and last_modified <= if_modified_since
+
+    def should_store(self, request, response):
+        """ False for responses that belong to one visitor """
+        return not request.META.get('CSRF_COOKIE_USED') and not response.cookies
+
+    def page_response(self, request, page):
+        if self.is_not_modified(request, page['etag'], page['last_modified']):
+            response = HttpResponseNotModified()
+        else:
+            response = HttpResponse(page['content'])
+        response['ETag'] = page['etag']
+        response['Last-Modified'] = http_date(page['last_modified'])
+        patch_vary_headers(response, ('Cookie',))
+        return response
+
     def _handler(self, request, *args, **kwargs):
-        # Rethinking of this logic in 5 years, aka, working around RequestContext that doesn't seem to actually work
-        context = {}
-        for processor in Engine.get_default().context_processors:
-            context.update(import_string(processor)(self.request))
+        cache_key = self.get_cache_key(request)
+        if cache_key:
+            page = get_cache().get(cache_key)
+            if page:
+                get_stats('pages').hit()
+                return self.page_response(request, page)
+            get_stats('pages').miss()
+        registry.preload_once()
+        # navigation() is memoized on the request, the RequestContext used for rendering reuses it
+        context = navigation(request)
         if context['page'] and context['exact_match']:
             if context['page'].redirect_url:
                 if context['page'].redirect_permanent:
@@ -35,23 +123,45 @@ class NavigationView(View):
                 else:
                     return HttpResponseRedirect(context['page'].redirect_url)
             if context['page'].view:
-                if context['page'].view.find('.as_view(') != -1:
-                    pass
-                else:
-                    cls = get_callable(context['page'].view)
-                    return cls(request)
+                view = registry.get_view(context['page'].view)
+                if view:
+                    return view(request)
             if context['page'].template:
                 self.template_name = context['page'].template
             elif context['page'].inherit_template:
                 for i in context['pageA']:
                     if i.template:
                         self.template_name = i.template
-            content = loader.render_to_string(self.template_name, context)
-            return HttpResponse(content)
+            etag, last_modified = self.get_validators(request, context)
+            if self.is_not_modified(request, etag, last_modified):
+                return self.page_response(request, {'etag': etag, 'last_modified': last_modified})
+            page = {
+                'content': registry.get_template(self.template_name).render(context, request),
+                'etag': etag,
+                'last_modified': last_modified,
+            }
+            response = self.page_response(request, page)
+            if cache_key and self.should_store(request, response):
+                get_cache().set(cache_key, page, settings.SIMPLE_CMS_PAGE_CACHE)
+            return response
 
         raise Http404
 
-class ArticleListView(ListView):
+class SeoPrefetchMixin(object):
+    """ Loads the Seo of every listed object in one query, see Seo.objects.prefetch """
+
+    def get_context_data(self, **kwargs):
+        context = super(SeoPrefetchMixin, self).get_context_data(**kwargs)
+        object_list = Seo.objects.prefetch(context['object_list'])
+        context['object_list'] = object_list
+        if context.get('page_obj'):
+            context['page_obj'].object_list = object_list
+        context_object_name = self.get_context_object_name(self.object_list)
+        if context_object_name:
+            context[context_object_name] = object_list
+        return context
+
+class ArticleListView(CursorPaginationMixin, SeoPrefetchMixin, ListView):
 
     def get_context_data(self, **kwargs):
         context = super(ArticleListView, self).get_context_data(**kwargs)
@@ -60,30 +170,32 @@ class ArticleListView(ListView):
 
 class ArticleDetailView(DateDetailView):
     fetch_sequence = True
+    # 'category' or 'tag' keeps previous/next within the article's categories or tags
+    sequence_within = None
+
+    def get_sequence_queryset(self):
+        """ None walks the cached published ids, see PublishedManager.get_adjacent """
+        if self.sequence_within == 'category':
+            return Article.objects.get_published().filter(categories__in=self.object.categories.all()).distinct()
+        elif self.sequence_within == 'tag':
+            return Article.objects.get_published().filter(tags__in=self.object.tags.all()).distinct()
+        return None
 
     def get_context_data(self, **kwargs):
         context = super(ArticleDetailView, self).get_context_data(**kwargs)
         #context['article_search_form'] = ArticleSearchForm()
-        if len(self.object.seo.all()) == 1:
-            context.update({'seo': self.object.seo.all()[0]})
+        seo = self.object.get_seo()
+        if seo:
+            context.update({'seo': seo})
         if self.fetch_sequence:
-            # grab sequence of id, then find
-            ids = Article.objects.get_active().values_list('id', flat=True)
-            # generator?
-            for i, _id in enumerate(ids):
-                if self.object.pk == _id:
-                    try:
-                        context.update({'previous_article': Article.objects.get(pk=ids[i+1])})
-                    except:
-                        pass
-                    try:
-                        context.update({'next_article': Article.objects.get(pk=ids[i-1])})
-                    except:
-                        pass
-                    break
+            previous_article, next_article = Article.objects.get_adjacent(self.object, self.get_sequence_queryset())
+            if previous_article:
+                context.update({'previous_article': previous_article})
+            if next_article:
+                context.update({'next_article': next_article})
         return context
 
-class ArticleTagView(ListView):
+class ArticleTagView(CursorPaginationMixin, SeoPrefetchMixin, ListView):
 
     def get(self, request, *args, **kwargs):
         self.tag = kwargs['slug']
@@ -97,7 +209,7 @@ class ArticleTagView(ListView):
         context.update({'tag': self.tag})
         return context
 
-class ArticleCategoryView(ListView):
+class ArticleCategoryView(CursorPaginationMixin, SeoPrefetchMixin, ListView):
 
     def get(self, request, *args, **kwargs):
         self.category = Category.objects.get(slug=kwargs['slug'], active=True)
@@ -111,7 +223,7 @@ class ArticleCategoryView(ListView):
         context.update({'category': self.category})
         return context
 
-class ArticleSearchView(ListView):
+class ArticleSearchView(CursorPaginationMixin, SeoPrefetchMixin, ListView):
 
     def get(self, request, *args, **kwargs):
         self.form = ArticleSearchForm(request.GET or None)
@@ -120,13 +232,8 @@ class ArticleSearchView(ListView):
     def get_queryset(self):
         articles = []
         if self.form.is_valid():
-            keywords = self.form.cleaned_data['q']
-            articles = Article.objects.get_active()
-            articles = articles.filter(
-                Q(title__icontains=keywords) |
-                Q(text__icontains=keywords) |
-                Q(excerpt__icontains=keywords) |
-                Q(tags__name__in=[keywords])).distinct()
+            # best match first, each article carrying search_rank and search_snippet
+            articles = self.form.search()
         return articles
 
     def get_context_data(self, **kwargs):
@@ -135,7 +242,7 @@ class ArticleSearchView(ListView):
         context['article_search_form'] = self.form
         return context
 
-class ArticleYearView(ListView):
+class ArticleYearView(CursorPaginationMixin, SeoPrefetchMixin, ListView):
 
     def get(self, request, *args, **kwargs):
         self.year = kwargs['year']